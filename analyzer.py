@@ -1,118 +1,319 @@
 # analyzer.py
 import pandas as pd
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import os
-import glob
+import math
+
+from log_format import read_log_header
+from log_catalog import LogCatalog
+
+# Logs larger than this are analyzed in chunks instead of being loaded whole
+STREAMING_THRESHOLD_BYTES = 50 * 1024 * 1024
+CHUNK_SIZE = 100_000
+
+# Plots are downsampled to about this many points
+MAX_PLOT_POINTS = 2000
+
+def time_weighted_average(df):
+    """Average count weighted by how long each count lasted"""
+    if len(df) < 2:
+        return df['count'].mean()
+    durations = df['timestamp'].diff().shift(-1).dt.total_seconds().iloc[:-1]
+    total = durations.sum()
+    if total <= 0:
+        return df['count'].mean()
+    return (df['count'].iloc[:-1] * durations).sum() / total
+
+def expand_change_log(df, interval):
+    """Turn a change-only log back into one row every `interval` seconds"""
+    if df.empty:
+        return df
+    series = df.set_index('timestamp')['count']
+    series = series[~series.index.duplicated(keep='last')]
+    grid = pd.date_range(series.index[0], series.index[-1], freq=pd.Timedelta(seconds=float(interval)))
+    expanded = series.reindex(series.index.union(grid)).ffill().reindex(grid)
+    return pd.DataFrame({'timestamp': expanded.index, 'count': expanded.astype(int).values})
+
+def iter_log_chunks(file_path, chunksize=CHUNK_SIZE):
+    """Read a log in DataFrame chunks of at most `chunksize` rows"""
+    for chunk in pd.read_csv(file_path, comment='#', chunksize=chunksize):
+        chunk['timestamp'] = pd.to_datetime(chunk['timestamp'])
+        yield chunk
+
+class StreamingStats:
+    def __init__(self):
+        """Log statistics computed in a single pass over chunks, in constant memory"""
+        self.total = 0
+        self.count_sum = 0
+        self.max_count = None
+        self.min_count = None
+        self.peak_time = None
+        self.first_time = None
+        self.last_time = None
+        self.weighted_sum = 0.0
+        self.weighted_seconds = 0.0
+        self._last_row = None
+
+    def update(self, chunk):
+        if chunk.empty:
+            return
+        counts = chunk['count']
+        times = chunk['timestamp']
+
+        self.total += len(chunk)
+        self.count_sum += int(counts.sum())
+        chunk_max = counts.max()
+        if self.max_count is None or chunk_max > self.max_count:
+            self.max_count = chunk_max
+            self.peak_time = times.loc[counts.idxmax()]
+        chunk_min = counts.min()
+        if self.min_count is None or chunk_min < self.min_count:
+            self.min_count = chunk_min
+        if self.first_time is None:
+            self.first_time = times.iloc[0]
+        self.last_time = times.iloc[-1]
+
+        # Time-weighted sum, carrying the previous chunk's last row across the boundary
+        if self._last_row is not None:
+            times = pd.concat([pd.Series([self._last_row[0]]), times], ignore_index=True)
+            counts = pd.concat([pd.Series([self._last_row[1]]), counts], ignore_index=True)
+        durations = times.diff().dt.total_seconds().iloc[1:].to_numpy()
+        self.weighted_sum += float((counts.iloc[:-1].to_numpy() * durations).sum())
+        self.weighted_seconds += float(durations.sum())
+        self._last_row = (times.iloc[-1], counts.iloc[-1])
+
+    def result(self, log_mode='interval'):
+        """Statistics in the same format as HeadcountAnalyzer.analyze_log"""
+        average = self.count_sum / self.total if self.total else float('nan')
+        weighted = self.weighted_sum / self.weighted_seconds if self.weighted_seconds > 0 else average
+        return {
+            'log_mode': log_mode,
+            'total_observations': self.total,
+            'time_period': f"{self.first_time} to {self.last_time}",
+            'average_count': weighted if log_mode == 'change_only' else average,
+            'time_weighted_average': weighted,
+            'max_count': self.max_count,
+            'min_count': self.min_count,
+            'peak_time': self.peak_time,
+        }
+
+def minmax_downsample(df, max_points=MAX_PLOT_POINTS):
+    """Keep the min and max row of evenly sized buckets so peaks and dips survive"""
+    if len(df) <= max_points:
+        return df
+    bucket_size = math.ceil(len(df) / (max_points // 2))
+    buckets = pd.Series(range(len(df)), index=df.index) // bucket_size
+    keep = pd.concat([df['count'].groupby(buckets).idxmin(), df['count'].groupby(buckets).idxmax()])
+    return df.loc[sorted(set(keep))]
+
+def downsample_log(file_path, total_rows, max_points=MAX_PLOT_POINTS):
+    """Min/max downsample a log by streaming it, without loading it whole"""
+    if total_rows <= max_points:
+        return pd.concat(iter_log_chunks(file_path), ignore_index=True)
+
+    bucket_size = math.ceil(total_rows / (max_points // 2))
+    # Whole buckets per chunk so no bucket spans two chunks
+    chunksize = bucket_size * max(1, CHUNK_SIZE // bucket_size)
+    parts = [minmax_downsample(chunk, 2 * math.ceil(len(chunk) / bucket_size))
+             for chunk in iter_log_chunks(file_path, chunksize)]
+    return pd.concat(parts, ignore_index=True)
 
 class HeadcountAnalyzer:
     def __init__(self, logs_dir='data/logs'):
         """Initialize the headcount analyzer"""
         self.logs_dir = logs_dir
+        self.catalog = LogCatalog(logs_dir)
         
-    def get_available_logs(self):
-        """Get a list of available log files"""
-        log_files = glob.glob(f"{self.logs_dir}/*.csv")
-        return [os.path.basename(f) for f in log_files]
-        
-    def analyze_log(self, log_file):
-        """Analyze a specific log file"""
-        # Full path to the log file
-        file_path = os.path.join(self.logs_dir, log_file) if not log_file.startswith(self.logs_dir) else log_file
+    def get_available_logs(self, room=None, date=None):
+        """Get a list of available log files, optionally only a room's or a YYYY-mm-dd date's"""
+        return [entry['file'] for entry in self.catalog.logs(room, date)]
         
-        # Check if file exists
-        if not os.path.exists(file_path):
-            print(f"Error: Log file {file_path} not found")
+    def analyze_log(self, log_file, expand=False):
+        """Analyze a specific log file
+
+        Change-only logs are analyzed with time-weighted averages. With expand
+        their data is also filled back out to one row per logged interval.
+        """
+        file_path = self._log_path(log_file)
+        if not file_path:
             return None
             
         # Read the CSV
         try:
-            df = pd.read_csv(file_path)
+            header = read_log_header(file_path)
+            change_only = header['mode'] == 'change_only'
+            
+            df = pd.read_csv(file_path, comment='#')
             # Convert timestamp to datetime
             df['timestamp'] = pd.to_datetime(df['timestamp'])
             
+            weighted_average = time_weighted_average(df)
+            
             # Basic statistics
             stats = {
+                'log_mode': header['mode'],
                 'total_observations': len(df),
                 'time_period': f"{df['timestamp'].min()} to {df['timestamp'].max()}",
-                'average_count': df['count'].mean(),
+                # Rows of a change-only log are not evenly spaced, only the
+                # time-weighted average is meaningful
+                'average_count': weighted_average if change_only else df['count'].mean(),
+                'time_weighted_average': weighted_average,
                 'max_count': df['count'].max(),
                 'min_count': df['count'].min(),
                 'peak_time': df.loc[df['count'].idxmax(), 'timestamp'],
             }
             
+            if change_only and expand:
+                df = expand_change_log(df, header.get('interval', 5))
+            
             return {
                 'stats': stats,
-                'data': df
+                'data': df,
+                'change_only': change_only and not expand
             }
             
         except Exception as e:
             print(f"Error analyzing log file: {e}")
             return None
             
-    def visualize_log(self, log_file, save_path=None):
-        """Create visualization of headcount data"""
-        analysis = self.analyze_log(log_file)
-        if not analysis:
-            return False
+    def _log_path(self, log_file):
+        """Full path to a log file, or None (with an error printed) if it doesn't exist"""
+        file_path = os.path.join(self.logs_dir, log_file) if not log_file.startswith(self.logs_dir) else log_file
+        
+        # Check if file exists
+        if not os.path.exists(file_path):
+            print(f"Error: Log file {file_path} not found")
+            return None
+        return file_path
+    
+    def is_large_log(self, log_file):
+        """Whether a log is big enough to be analyzed in chunks"""
+        file_path = self._log_path(log_file)
+        return bool(file_path) and os.path.getsize(file_path) > STREAMING_THRESHOLD_BYTES
+    
+    def analyze_log_streaming(self, log_file, chunksize=CHUNK_SIZE, max_points=None):
+        """Analyze a log in chunks with bounded memory, computing all stats in one pass
+
+        The returned 'data' is None unless max_points is given, in which case
+        it is the log min/max downsampled to about that many points.
+        """
+        file_path = self._log_path(log_file)
+        if not file_path:
+            return None
+        
+        try:
+            header = read_log_header(file_path)
+            stats = StreamingStats()
+            for chunk in iter_log_chunks(file_path, chunksize):
+                stats.update(chunk)
+            if stats.total == 0:
+                print(f"Error analyzing log file: {log_file} has no rows")
+                return None
+            
+            data = downsample_log(file_path, stats.total, max_points) if max_points else None
+            return {
+                'stats': stats.result(header['mode']),
+                'data': data,
+                'change_only': header['mode'] == 'change_only'
+            }
+        except Exception as e:
+            print(f"Error analyzing log file: {e}")
+            return None
             
+    def analyze_for_plot(self, log_file, max_points=MAX_PLOT_POINTS):
+        """Analysis with its data min/max downsampled to about max_points points
+
+        Large logs are streamed instead of loaded whole.
+        """
+        if self.is_large_log(log_file):
+            analysis = self.analyze_log_streaming(log_file, max_points=max_points)
+        else:
+            analysis = self.analyze_log(log_file)
+        if analysis:
+            analysis['data'] = minmax_downsample(analysis['data'], max_points)
+        return analysis
+    
+    def plot_analysis(self, ax, analysis, title):
+        """Draw an analysis onto a matplotlib Axes"""
         df = analysis['data']
         stats = analysis['stats']
+        # Markers only help while individual samples can still be told apart
+        marker = 'o' if len(df) <= 200 else None
         
-        # Create figure
-        plt.figure(figsize=(12, 6))
-        
-        # Plot headcount over time
-        plt.plot(df['timestamp'], df['count'], marker='o', linestyle='-', color='blue')
+        # Plot headcount over time, change-only rows hold their count until the next row
+        if analysis['change_only']:
+            ax.plot(df['timestamp'], df['count'], drawstyle='steps-post', linestyle='-', color='blue')
+        else:
+            ax.plot(df['timestamp'], df['count'], marker=marker, linestyle='-', color='blue')
         
         # Add horizontal line for average
-        plt.axhline(y=stats['average_count'], color='r', linestyle='--', alpha=0.7, 
+        ax.axhline(y=stats['average_count'], color='r', linestyle='--', alpha=0.7, 
                    label=f"Average: {stats['average_count']:.1f}")
         
         # Annotate peak
         max_idx = df['count'].idxmax()
-        plt.annotate(f"Peak: {df['count'].max()}",
+        ax.annotate(f"Peak: {df['count'].max()}",
                     xy=(df.loc[max_idx, 'timestamp'], df.loc[max_idx, 'count']),
                     xytext=(10, 20),
                     textcoords='offset points',
                     arrowprops=dict(arrowstyle='->'))
         
         # Format plot
-        plt.title(f"Headcount Analysis - {os.path.basename(log_file)}")
-        plt.xlabel("Time")
-        plt.ylabel("Number of People")
-        plt.grid(True, alpha=0.3)
-        plt.legend()
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        
-        # Save or show
+        ax.set_title(title)
+        ax.set_xlabel("Time")
+        ax.set_ylabel("Number of People")
+        ax.grid(True, alpha=0.3)
+        ax.legend()
+        ax.tick_params(axis='x', labelrotation=45)
+        
+    def render_figure(self, log_file, max_points=MAX_PLOT_POINTS, analysis=None):
+        """Build the chart for a log as a standalone Figure, or None
+
+        Doesn't touch pyplot's global state, so it is safe to call from several
+        threads or processes at once. An analysis from analyze_for_plot can be
+        passed in to avoid reading the log again.
+        """
+        analysis = analysis or self.analyze_for_plot(log_file, max_points)
+        if not analysis:
+            return None
+        
+        fig = Figure(figsize=(12, 6))
+        FigureCanvasAgg(fig)
+        self.plot_analysis(fig.add_subplot(), analysis, f"Headcount Analysis - {os.path.basename(log_file)}")
+        fig.tight_layout()
+        return fig
+            
+    def visualize_log(self, log_file, save_path=None, max_points=MAX_PLOT_POINTS):
+        """Create visualization of headcount data
+
+        Plots are min/max downsampled to about max_points points and large logs
+        are streamed instead of loaded whole.
+        """
+        # Save
         if save_path:
-            plt.savefig(save_path)
+            fig = self.render_figure(log_file, max_points)
+            if fig is None:
+                return False
+            fig.savefig(save_path)
             print(f"Visualization saved to {save_path}")
-        else:
-            plt.show()
-            
-        return True
+            return True
         
-    def generate_report(self, log_file=None):
-        """Generate a text report of headcount analysis"""
-        # If no log specified, use the most recent
-        if not log_file:
-            logs = self.get_available_logs()
-            if not logs:
-                print("No log files found")
-                return
-            log_file = max(logs, key=lambda x: os.path.getmtime(os.path.join(self.logs_dir, x)))
-            
-        # Analyze the log
-        analysis = self.analyze_log(log_file)
+        # Show, interactive windows need pyplot
+        analysis = self.analyze_for_plot(log_file, max_points)
         if not analysis:
-            return
-            
-        stats = analysis['stats']
+            return False
+        fig, ax = plt.subplots(figsize=(12, 6))
+        self.plot_analysis(ax, analysis, f"Headcount Analysis - {os.path.basename(log_file)}")
+        fig.tight_layout()
+        plt.show()
+        plt.close(fig)
+        return True
         
-        # Generate report text
-        report = f"""
+    def format_report(self, log_file, stats):
+        """Text report for a log's statistics"""
+        return f"""
         ============================================
         HEADCOUNT ANALYSIS REPORT
         ============================================
@@ -120,9 +321,11 @@ class HeadcountAnalyzer:
         
         Time period: {stats['time_period']}
         Total observations: {stats['total_observations']}
+        Log mode: {stats['log_mode']}
         
         STATISTICS:
         - Average count: {stats['average_count']:.2f} people
+        - Time-weighted average: {stats['time_weighted_average']:.2f} people
         - Maximum count: {stats['max_count']} people
         - Minimum count: {stats['min_count']} people
         - Peak time: {stats['peak_time']}
@@ -132,7 +335,27 @@ class HeadcountAnalyzer:
         ============================================
         """
         
-        print(report)
+    def generate_report(self, log_file=None, print_report=True):
+        """Generate a text report of headcount analysis"""
+        # If no log specified, use the most recent
+        if not log_file:
+            log_file = self.catalog.latest()
+            if not log_file:
+                print("No log files found")
+                return
+            
+        # Analyze the log, streaming it if it is too big to load whole
+        if self.is_large_log(log_file):
+            analysis = self.analyze_log_streaming(log_file)
+        else:
+            analysis = self.analyze_log(log_file)
+        if not analysis:
+            return
+            
+        report = self.format_report(log_file, analysis['stats'])
+        
+        if print_report:
+            print(report)
         return report
 
 # For direct execution
@@ -1,91 +1,362 @@
 # api.py
 from flask import Flask, jsonify, request, send_file
-from flask_cors import CORS 
+from flask_cors import CORS
 import threading
 import time
 from headcount import HeadcountDetector
+from singleflight import SingleFlight
+from state_store import HeadcountStore
+from pipeline import StateStoreSink, CollectSink
+from cluster import Coordinator, load_classrooms
+from camera_health import CameraHealthRegistry
+from sampling_scheduler import AdaptiveScheduler, load_schedules
+from degradation import DegradationController, DEFAULT_LEVEL
+import argparse
+import json
 import os
 import io
 
+# Front ends allowed to call the API from the browser
+CORS_ORIGINS = ["http://localhost:5173", "http://localhost:3000", "https://yourdomain.com"]
+
 app = Flask(__name__)
-CORS(app, resources={r"/api/*": {"origins": ["http://localhost:5173", "http://localhost:3000", "https://yourdomain.com"]}})
+CORS(app, resources={r"/api/*": {"origins": CORS_ORIGINS}})
+
+# Map of room IDs to camera IDs
+ROOM_CAMERAS = {
+    "3la": 0,  # Laptop camera for testing
+    # Add more rooms in the future: "3lb": 1, "3lc": 2, etc.
+}
+
+# A JSON object in HEADCOUNT_ROOM_CAMERAS replaces the map, e.g. to point the
+# rooms at simulated cameras for load testing (see loadtest.py)
+if os.environ.get('HEADCOUNT_ROOM_CAMERAS'):
+    ROOM_CAMERAS = {
+        room_id.lower(): camera for room_id, camera in json.loads(os.environ['HEADCOUNT_ROOM_CAMERAS']).items()
+    }
+
+# Concurrent immediate/image requests for the same room within this many
+# seconds share a single capture and inference run
+COALESCE_WINDOW = 1.0
+
+# Inferences per second the background worker may spend across all rooms, the
+# rate for an occupied room whose count is stable (every 5 seconds, as before
+# the scheduler) and the slowest/fastest any single room is sampled (samples
+# per second)
+INFERENCE_BUDGET = 1.0
+BASE_ROOM_RATE = 1 / 5
+MIN_ROOM_RATE = 1 / 300
+MAX_ROOM_RATE = 1 / 2
+
+# Seconds a background sample's inference (plus how late the sample ran) may
+# take before the degradation controller switches to a cheaper profile
+LATENCY_TARGET = 1.0
+
+# Best profile the degradation controller may step up to when there is
+# headroom. DEFAULT_LEVEL keeps the standard model, 0 also allows "full"
+# (yolov8s.pt, a much heavier model that may have to be downloaded)
+BEST_PROFILE_LEVEL = DEFAULT_LEVEL
+
+# Seconds to wait for a camera to open or return a frame before giving up
+CAMERA_OPEN_TIMEOUT = 10
+CAMERA_READ_TIMEOUT = 5
+
+# Seconds of history kept per room, sized for a room sampled at MAX_ROOM_RATE
+HISTORY_SECONDS = 3600
+
+# Latest headcount and recent history for each room
+store = HeadcountStore(history_size=int(HISTORY_SECONDS * MAX_ROOM_RATE))
+
+# One detector (and model) per room, shared by the worker and the endpoints
+detectors = {}
+detectors_lock = threading.Lock()
+
+# Only one capture at a time per camera device
+camera_locks = {room_id: threading.Lock() for room_id in ROOM_CAMERAS}
+
+coalescer = SingleFlight(window=COALESCE_WINDOW)
+
+# Failing cameras are backed off so they don't hold up the working ones
+camera_health = CameraHealthRegistry(ROOM_CAMERAS)
+
+# Spends the inference budget where counts are changing or lectures are on
+scheduler = AdaptiveScheduler(
+    ROOM_CAMERAS,
+    budget=INFERENCE_BUDGET,
+    base_rate=BASE_ROOM_RATE,
+    min_rate=MIN_ROOM_RATE,
+    max_rate=MAX_ROOM_RATE,
+    store=store,
+    schedules=load_schedules(),
+    is_ready=camera_health.ready
+)
+
+def apply_profile(profile):
+    """Switch every detector and the sampling budget to a degradation profile"""
+    with detectors_lock:
+        current = list(detectors.values())
+    # Loading weights is slow (it may even download them), so it happens
+    # outside the lock. Each detector swaps its model in once it is loaded.
+    for detector in current:
+        detector.set_profile(profile["model"], profile["imgsz"])
+    scheduler.set_budget(INFERENCE_BUDGET * profile["rate_factor"], BASE_ROOM_RATE * profile["rate_factor"])
+
+# Trades model size, input resolution and sampling rate for latency under load
+degradation = DegradationController(latency_target=LATENCY_TARGET, on_change=apply_profile,
+                                    best_level=BEST_PROFILE_LEVEL)
+
+# Set by --distributed (see enable_distributed), the node then has no cameras
+# of its own and only serves what the worker nodes publish
+distributed = False
+
+# Hands out the rooms in config/classrooms.json to worker nodes, only created
+# in distributed mode
+coordinator = None
+
+# Cluster endpoints on a node that samples its own cameras
+NOT_DISTRIBUTED = {"error": "This node is not running in distributed mode"}, 409
+
+def enable_distributed(config_path='config/classrooms.json'):
+    """Switch this node to coordinating worker nodes for the rooms in the config"""
+    global distributed, coordinator
+    coordinator = Coordinator(load_classrooms(config_path), store)
+    distributed = True
+
+def room_known(room_id):
+    """Whether a (lowercase) room ID is served by this node"""
+    return room_id in (coordinator.rooms if distributed else ROOM_CAMERAS)
+
+def published_count(room_id, max_staleness=None):
+    """(payload, status) for an immediate count on a distributed node
+
+    The coordinator has no cameras, so this is the latest count a worker
+    published, or a 503 if there is none (recent enough).
+    """
+    age = store.age(room_id)
+    if age is None or (max_staleness is not None and age > max_staleness):
+        return {"error": f"No recent count for room {room_id} from the worker nodes"}, 503
+    return store.latest(room_id), 200
+
+# Images only exist on the worker nodes in distributed mode
+NO_IMAGES_IN_DISTRIBUTED_MODE = {"error": "Images are not available from the coordinator in distributed mode"}, 503
+
+def get_detector(room_id):
+    """Get the shared detector for a room, creating it on first use"""
+    with detectors_lock:
+        if room_id not in detectors:
+            profile = degradation.profile
+            detectors[room_id] = HeadcountDetector(
+                camera_id=ROOM_CAMERAS[room_id],
+                confidence=0.5,
+                model_path=profile["model"],
+                imgsz=profile["imgsz"],
+                open_timeout=CAMERA_OPEN_TIMEOUT,
+                read_timeout=CAMERA_READ_TIMEOUT
+            )
+        return detectors[room_id]
+
+def parse_since(value):
+    """Parse a ?since= value given as epoch seconds or YYYY-mm-dd HH:MM:SS"""
+    try:
+        return float(value)
+    except ValueError:
+        return time.mktime(time.strptime(value, "%Y-%m-%d %H:%M:%S"))
+
+def history_payload(room_id, since_arg=None):
+    """(payload, status) for a room's history, since_arg is the raw ?since= value"""
+    try:
+        since = parse_since(since_arg) if since_arg else None
+    except ValueError:
+        return {"error": f"Invalid since value: {since_arg}"}, 400
+
+    history = store.history(room_id, since)
+    if history is None:
+        return {"error": f"Room {room_id} not found"}, 404
+
+    timestamps, counts = history
+    samples = [
+        {"timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts)), "epoch": float(ts), "count": int(count)}
+        for ts, count in zip(timestamps, counts)
+    ]
+    return {"room_id": room_id, "samples": samples}, 200
+
+def heartbeat_payload(data):
+    """(payload, status) for a worker node's heartbeat request body"""
+    if not distributed:
+        return NOT_DISTRIBUTED
+    worker_id = data.get('worker_id')
+    if not worker_id:
+        return {"error": "worker_id is required"}, 400
+    return {"worker_id": worker_id, "rooms": coordinator.heartbeat(worker_id)}, 200
+
+def parse_publish(data):
+    """(worker_id, room_id, count, timestamp) from a publish request body, raises ValueError if incomplete"""
+    try:
+        timestamp = float(data['timestamp']) if data.get('timestamp') is not None else None
+        return data['worker_id'], data['room_id'], int(data['count']), timestamp
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("worker_id, room_id and count are required")
+
+def publish_payload(data):
+    """(payload, status) for a worker node's publish request body"""
+    if not distributed:
+        # Would overwrite the counts of the local background worker
+        return NOT_DISTRIBUTED
+    try:
+        worker_id, room_id, count, timestamp = parse_publish(data)
+    except ValueError as e:
+        return {"error": str(e)}, 400
 
-# Global dictionary to store headcount data for each room
-headcount_data = {}
+    if not coordinator.publish(worker_id, room_id, count, timestamp):
+        return {"accepted": False, "error": f"Room {room_id} is not assigned to {worker_id}"}, 409
+    return {"accepted": True}, 200
+
+def cluster_status_payload():
+    """(payload, status) with the live worker nodes and their room assignments"""
+    if not distributed:
+        return NOT_DISTRIBUTED
+    return coordinator.status(), 200
+
+def with_camera(room_id, capture):
+    """Run a capture on the room's camera, recording the outcome in its health"""
+    detector = get_detector(room_id)
+    with camera_locks[room_id]:
+        started = time.time()
+        try:
+            result = capture(detector)
+        except Exception as e:
+            camera_health.record_failure(room_id, e)
+            raise
+    camera_health.record_success(room_id, time.time() - started)
+    return result
+
+def capture_count(room_id):
+    """Open the room's camera, count people and update the cached data"""
+    with_camera(room_id, lambda d: d.get_current_count(sinks=[StateStoreSink(store, room_id)]))
+    return store.latest(room_id)
+
+def capture_count_with_image(room_id):
+    """Open the room's camera, count people and return the annotated image"""
+    return with_camera(room_id, lambda d: d.get_current_count_with_image(sinks=[StateStoreSink(store, room_id)]))
+
+def due_room():
+    """(room_id, 0) for the room to sample now, or (None, seconds to sleep first)
+
+    Backed off cameras are skipped. Sleeps are at most a second so budget
+    changes apply quickly.
+    """
+    room_id, wait = scheduler.next_room()
+    if room_id is None or wait > 0:
+        return None, min(wait, 1.0)
+    return room_id, 0.0
+
+def sample_room(room_id):
+    """One background sample of a room, fed to the scheduler and the degradation controller"""
+    lag = scheduler.lag(room_id)
+    try:
+        # Get current frame and count, update the store
+        collector = CollectSink()
+        with_camera(room_id, lambda d: d.get_current_count(sinks=[StateStoreSink(store, room_id), collector]))
+        result = collector.results[0]
+
+        print(f"Updated count for room {room_id}: {result.count} people")
+        degradation.observe(result.inference_time, lag)
+    except Exception as e:
+        print(f"Error processing room {room_id}: {str(e)}")
+    scheduler.record(room_id)
+    # May load a new model
+    degradation.evaluate()
+
+def unavailable_answer(room_id):
+    """(payload, 503, headers) for a room whose camera is backed off, or None if it may be tried"""
+    if camera_health.ready(room_id):
+        return None
+    health = camera_health.get(room_id)
+    payload = {"error": f"Camera for room {room_id} is unavailable", "health": health}
+    return payload, 503, {'Retry-After': str(int(health["retry_after"]) + 1)}
+
+def immediate_answer(room_id, max_staleness=None):
+    """(payload, status, headers) for an /immediate request that needs no capture, or None
+
+    That is an unknown room, a distributed node, a recent enough background
+    sample (max_staleness) or a backed off camera.
+    """
+    if not room_known(room_id):
+        return {"error": f"Room {room_id} not found"}, 404, {}
+    if distributed:
+        return (*published_count(room_id, max_staleness), {})
+
+    age = store.age(room_id)
+    if max_staleness is not None and age is not None and age <= max_staleness:
+        return store.latest(room_id), 200, {}
+    return unavailable_answer(room_id)
+
+def image_answer(room_id):
+    """(payload, status, headers) for an /image request that can't be captured, or None"""
+    if not room_known(room_id):
+        return {"error": f"Room {room_id} not found"}, 404, {}
+    if distributed:
+        return (*NO_IMAGES_IN_DISTRIBUTED_MODE, {})
+    return unavailable_answer(room_id)
+
+def count_capture(room_id):
+    """(coalescing key, blocking capture, max_age) for a fresh count, shared with concurrent requests"""
+    return ('count', room_id), lambda: capture_count(room_id), None
+
+def image_capture(room_id, max_staleness=None):
+    """(coalescing key, blocking capture, max_age) for a fresh count and image
+
+    A recent image capture is reused for up to max_staleness seconds.
+    """
+    return ('image', room_id), lambda: capture_count_with_image(room_id), max(COALESCE_WINDOW, max_staleness or 0)
 
 # Background thread to run detections for all cameras
 def detection_worker():
-    # Map of room IDs to camera IDs
-    room_cameras = {
-        "3la": 0,  # Laptop camera for testing
-        # Add more rooms in the future: "3lb": 1, "3lc": 2, etc.
-    }
-    
-    # Create detectors for each room
-    detectors = {}
-    for room_id, camera_id in room_cameras.items():
-        detectors[room_id] = HeadcountDetector(camera_id=camera_id, confidence=0.5)
-    
     while True:
-        # Process each room
-        for room_id, detector in detectors.items():
-            try:
-                # Get current frame and count
-                count = detector.get_current_count()
-                
-                # Update the global data
-                headcount_data[room_id] = {
-                    "count": count,
-                    "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                    "room_id": room_id
-                }
-                
-                print(f"Updated count for room {room_id}: {count} people")
-            except Exception as e:
-                print(f"Error processing room {room_id}: {str(e)}")
-        
-        # Wait for next update interval (3 minutes)
-        time.sleep(5)  # every 5 sec
+        room_id, wait = due_room()
+        if room_id is None:
+            time.sleep(wait)
+            continue
+
+        sample_room(room_id)
 
 # API endpoint to get headcount for a specific room
 @app.route('/api/headcount/<room_id>', methods=['GET'])
 def get_room_headcount(room_id):
-    if room_id in headcount_data:
-        return jsonify(headcount_data[room_id])
+    room_id = room_id.lower()
+    data = store.latest(room_id)
+    if data:
+        return jsonify(data)
     else:
         return jsonify({"error": f"Room {room_id} not found"}), 404
 
 # API endpoint to get headcount for all rooms
 @app.route('/api/headcount', methods=['GET'])
 def get_all_headcount():
-    return jsonify(list(headcount_data.values()))
+    return jsonify(store.all_latest())
+
+# API endpoint to get recent headcount history for a room, served from memory
+# Optional ?since=<epoch seconds or YYYY-mm-dd HH:MM:SS> only returns newer samples
+@app.route('/api/headcount/<room_id>/history', methods=['GET'])
+def get_room_history(room_id):
+    payload, status = history_payload(room_id.lower(), request.args.get('since'))
+    return jsonify(payload), status
 
 # API endpoint to get current headcount with image for a specific room
+# Optional ?max_staleness=<seconds> reuses a recent image capture for the room
 @app.route('/api/headcount/<room_id>/image', methods=['GET'])
 def get_room_headcount_with_image(room_id):
-    # Map of room IDs to camera IDs
-    room_cameras = {
-        "3la": 0,  # Laptop camera for testing
-        # Add more rooms in the future: "3lb": 1, "3lc": 2, etc.
-    }
-    
-    if room_id not in room_cameras:
-        return jsonify({"error": f"Room {room_id} not found"}), 404
-    
+    room_id = room_id.lower()
+    answer = image_answer(room_id)
+    if answer:
+        payload, status, headers = answer
+        return jsonify(payload), status, headers
+
     try:
-        # Create detector for this room
-        detector = HeadcountDetector(camera_id=room_cameras[room_id], confidence=0.5)
-        
-        # Get current count and image
-        count, image_bytes = detector.get_current_count_with_image()
-        
-        # Update the global data
-        headcount_data[room_id] = {
-            "count": count,
-            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-            "room_id": room_id
-        }
-        
+        # Get current count and image, shared with concurrent requests
+        key, capture, max_age = image_capture(room_id, request.args.get('max_staleness', type=float))
+        count, image_bytes = coalescer.do(key, capture, max_age=max_age)
+
         # Return the image
         return send_file(
             io.BytesIO(image_bytes),
@@ -96,42 +367,78 @@ def get_room_headcount_with_image(room_id):
         return jsonify({"error": str(e)}), 500
 
 # Immediate count endpoint (doesn't wait for background worker)
+# Optional ?max_staleness=<seconds> serves the background worker's latest
+# sample instead when it is at most that old
 @app.route('/api/headcount/<room_id>/immediate', methods=['GET'])
 def get_immediate_headcount(room_id):
-    # Map of room IDs to camera IDs
-    room_cameras = {
-        "3la": 0,  # Laptop camera for testing
-        # Add more rooms in the future: "3lb": 1, "3lc": 2, etc.
-    }
-    
-    if room_id not in room_cameras:
-        return jsonify({"error": f"Room {room_id} not found"}), 404
-    
+    room_id = room_id.lower()
+    answer = immediate_answer(room_id, request.args.get('max_staleness', type=float))
+    if answer:
+        payload, status, headers = answer
+        return jsonify(payload), status, headers
+
     try:
-        # Create detector for this room
-        detector = HeadcountDetector(camera_id=room_cameras[room_id], confidence=0.5)
-        
-        # Get current count
-        count = detector.get_current_count()
-        
-        # Update the global data
-        current_data = {
-            "count": count,
-            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-            "room_id": room_id
-        }
-        
-        # Also update the cached data
-        headcount_data[room_id] = current_data
-        
-        return jsonify(current_data)
+        # Get current count, shared with concurrent requests for this room
+        key, capture, max_age = count_capture(room_id)
+        return jsonify(coalescer.do(key, capture, max_age=max_age))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Health of every room's camera
+@app.route('/api/health/cameras', methods=['GET'])
+def get_camera_health():
+    return jsonify(camera_health.all())
+
+# Health of a specific room's camera
+@app.route('/api/health/cameras/<room_id>', methods=['GET'])
+def get_room_camera_health(room_id):
+    room_id = room_id.lower()
+    health = camera_health.get(room_id)
+    if health is None:
+        return jsonify({"error": f"Room {room_id} not found"}), 404
+    return jsonify(health)
+
+# Current sampling rate and priority of every room
+@app.route('/api/scheduler', methods=['GET'])
+def get_scheduler_status():
+    return jsonify(scheduler.status())
+
+# Current degradation profile and the history of adjustments
+@app.route('/api/degradation', methods=['GET'])
+def get_degradation_status():
+    return jsonify(degradation.status())
+
+# Worker node heartbeat, returns the rooms the worker should process
+@app.route('/api/cluster/heartbeat', methods=['POST'])
+def cluster_heartbeat():
+    payload, status = heartbeat_payload(request.get_json(silent=True) or {})
+    return jsonify(payload), status
+
+# Worker node publishing a count for a room it owns
+@app.route('/api/cluster/publish', methods=['POST'])
+def cluster_publish():
+    payload, status = publish_payload(request.get_json(silent=True) or {})
+    return jsonify(payload), status
+
+# Live worker nodes and their room assignments
+@app.route('/api/cluster/status', methods=['GET'])
+def cluster_status():
+    payload, status = cluster_status_payload()
+    return jsonify(payload), status
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Headcount API server")
+    parser.add_argument('--distributed', action='store_true',
+                        help="Only coordinate worker nodes (see cluster.py) instead of running local detection")
+    parser.add_argument('--port', type=int, default=5000, help="Port to listen on")
+    args = parser.parse_args()
+    if args.distributed:
+        enable_distributed()
+
     # Start the detection thread
-    detection_thread = threading.Thread(target=detection_worker, daemon=True)
-    detection_thread.start()
-    
+    if not distributed:
+        detection_thread = threading.Thread(target=detection_worker, daemon=True)
+        detection_thread.start()
+
     # Start the Flask app
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    app.run(debug=True, host='0.0.0.0', port=args.port)
@@ -5,8 +5,108 @@ from tkinter import ttk, messagebox
 from headcount import HeadcountDetector
 from analyzer import HeadcountAnalyzer
 import threading
-import matplotlib.pyplot as plt
+import queue
+from collections import deque
+from datetime import datetime
+import matplotlib.dates as mdates
+from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from pipeline import FramePublisher
+
+# Points kept in the live chart's window
+LIVE_CHART_POINTS = 600
+
+# How often the UI picks up new live samples (milliseconds)
+LIVE_POLL_INTERVAL = 250
+
+class LiveChart:
+    def __init__(self, parent, max_points=LIVE_CHART_POINTS):
+        """One reusable figure for both log charts and the live detection chart
+
+        Live samples are kept for the whole session, also while something
+        else is shown, and drawn incrementally: only the line is redrawn over
+        a cached background (blitting) until new data runs past the axes
+        limits, which triggers a full redraw with limits a window further on.
+        """
+        self.figure = Figure(figsize=(8, 4))
+        self.ax = self.figure.add_subplot()
+        self.canvas = FigureCanvasTkAgg(self.figure, parent)
+        self.widget = self.canvas.get_tk_widget()
+
+        self.points = deque(maxlen=max_points)
+        self.line = None
+        self.background = None
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _on_draw(self, event):
+        """Cache everything but the live line after every full redraw"""
+        if self.line is None:
+            return
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.ax.draw_artist(self.line)
+
+    def show_analysis(self, analyzer, analysis, title):
+        """Draw a log analysis, replacing whatever was shown"""
+        self.line = None
+        self.background = None
+        self.ax.clear()
+        analyzer.plot_analysis(self.ax, analysis, title)
+        self.figure.tight_layout()
+        self.canvas.draw()
+
+    def clear_live(self):
+        """Forget the live samples, for a new detection session"""
+        self.points.clear()
+
+    def _live_limits(self):
+        """Axes limits that fit the live samples with a window of room to the right"""
+        if not self.points:
+            now = mdates.date2num(datetime.now())
+            return (now, now + 60 / 86400), (0, 10)
+        xs, ys = zip(*self.points)
+        span = max(xs[-1] - xs[0], 60 / 86400)
+        return (xs[0], xs[-1] + span), (0, max(10, max(ys) * 1.2))
+
+    def start_live(self, title):
+        """Show the live samples of the session so far and keep drawing new ones"""
+        self.ax.clear()
+        self.ax.set_title(title)
+        self.ax.set_xlabel("Time")
+        self.ax.set_ylabel("Number of People")
+        self.ax.grid(True, alpha=0.3)
+        self.ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
+        xlim, ylim = self._live_limits()
+        self.ax.set_xlim(*xlim)
+        self.ax.set_ylim(*ylim)
+        xs, ys = zip(*self.points) if self.points else ((), ())
+        self.line, = self.ax.plot(xs, ys, linestyle='-', color='blue', animated=True)
+        self.figure.tight_layout()
+        self.canvas.draw()
+
+    def add_samples(self, samples, draw=True):
+        """Append (timestamp, count) samples and, with draw, update the live line if it is shown"""
+        for timestamp, count in samples:
+            self.points.append((mdates.date2num(datetime.fromtimestamp(timestamp)), count))
+        if self.line is None or not samples or not draw:
+            return
+
+        xs, ys = zip(*self.points)
+        self.line.set_data(xs, ys)
+
+        _, x_max = self.ax.get_xlim()
+        _, y_max = self.ax.get_ylim()
+        if xs[-1] > x_max or max(ys) > y_max:
+            # Out of bounds, so redraw everything once. The x-axis jumps ahead by
+            # a whole window so the next redraw is a window's worth of samples
+            # away. Points dropping off the left edge don't need one.
+            xlim, ylim = self._live_limits()
+            self.ax.set_xlim(*xlim)
+            self.ax.set_ylim(*ylim)
+            self.canvas.draw()
+        elif self.background is not None:
+            self.canvas.restore_region(self.background)
+            self.ax.draw_artist(self.line)
+            self.canvas.blit(self.ax.bbox)
 
 class HeadcountApp:
     def __init__(self, root):
@@ -21,7 +121,12 @@ class HeadcountApp:
         self.detection_running = False
         self.current_log = None
         
+        # Samples from the detection thread waiting to be drawn by the UI thread
+        self.live_samples = queue.Queue()
+        self.live_location = None
+        
         self._create_ui()
+        self.root.after(LIVE_POLL_INTERVAL, self._poll_live_samples)
         
     def _create_ui(self):
         """Create the user interface"""
@@ -98,6 +203,7 @@ class HeadcountApp:
         
         ttk.Button(analysis_button_frame, text="Generate Report", command=self.generate_report).pack(side=tk.LEFT, padx=5)
         ttk.Button(analysis_button_frame, text="Visualize Data", command=self.visualize_data).pack(side=tk.LEFT, padx=5)
+        ttk.Button(analysis_button_frame, text="Live Chart", command=self.show_live_chart).pack(side=tk.LEFT, padx=5)
         
         # Results frame for visualization
         self.results_frame = ttk.LabelFrame(analysis_frame, text="Results", padding=10)
@@ -105,6 +211,11 @@ class HeadcountApp:
         analysis_frame.grid_rowconfigure(2, weight=1)
         analysis_frame.grid_columnconfigure(0, weight=1)
         
+        # Created once and swapped in and out, never rebuilt per click
+        self.report_text = tk.Text(self.results_frame, wrap=tk.WORD, height=15)
+        self.chart = LiveChart(self.results_frame)
+        self.live_chart_visible = False
+        
         # Initialize logs list
         self.refresh_logs()
         
@@ -112,8 +223,9 @@ class HeadcountApp:
         """Refresh the list of available logs"""
         logs = self.analyzer.get_available_logs()
         self.log_combobox['values'] = logs
-        if logs:
-            self.log_combobox.current(len(logs) - 1)  # Select most recent
+        latest = self.analyzer.catalog.latest()
+        if latest in logs:
+            self.log_combobox.current(logs.index(latest))  # Select most recent
             
     def start_detection(self):
         """Start the headcount detection process"""
@@ -133,6 +245,9 @@ class HeadcountApp:
         self.stop_button['state'] = tk.NORMAL
         self.status_var.set(f"Running detection for {location}...")
         self.detection_running = True
+        self.live_location = location
+        self.chart.clear_live()
+        self.show_live_chart()
         
         # Start detection in a separate thread
         self.detection_thread = threading.Thread(target=self._run_detection_thread, args=(location,))
@@ -142,7 +257,11 @@ class HeadcountApp:
     def _run_detection_thread(self, location):
         """Run detection in a background thread"""
         try:
-            self.current_log = self.detector.run_detection(location)
+            self.current_log = self.detector.run_detection(
+                location,
+                sinks=[FramePublisher(self._queue_live_sample)],
+                catalog=self.analyzer.catalog
+            )
             
             # Update UI from main thread
             self.root.after(0, self._detection_completed)
@@ -153,6 +272,7 @@ class HeadcountApp:
     def _detection_completed(self):
         """Called when detection completes successfully"""
         self.detection_running = False
+        self.live_chart_visible = False
         self.start_button['state'] = tk.NORMAL
         self.stop_button['state'] = tk.DISABLED
         self.status_var.set(f"Detection completed. Log saved.")
@@ -161,6 +281,7 @@ class HeadcountApp:
     def _detection_error(self, error_msg):
         """Called when detection encounters an error"""
         self.detection_running = False
+        self.live_chart_visible = False
         self.start_button['state'] = tk.NORMAL
         self.stop_button['state'] = tk.DISABLED
         self.status_var.set(f"Error: {error_msg}")
@@ -168,9 +289,16 @@ class HeadcountApp:
         
     def stop_detection(self):
         """Stop the headcount detection"""
-        # We can't directly stop the OpenCV loop, but we'll set a flag
         self.detection_running = False
-        self.status_var.set("Stopping detection (press 'q' in the camera window)...")
+        self.detector.stop_detection()
+        self.status_var.set("Stopping detection...")
+        
+    def _show_result(self, widget):
+        """Show one of the persistent result widgets and hide the other"""
+        for child in (self.report_text, self.chart.widget):
+            if child is not widget:
+                child.pack_forget()
+        widget.pack(fill=tk.BOTH, expand=True)
         
     def generate_report(self):
         """Generate an analysis report for the selected log"""
@@ -179,18 +307,16 @@ class HeadcountApp:
             messagebox.showwarning("No Log Selected", "Please select a log file to analyze.")
             return
             
-        # Clear previous results
-        for widget in self.results_frame.winfo_children():
-            widget.destroy()
-            
         # Generate report
         report = self.analyzer.generate_report(selected_log)
         
         # Display report
-        report_text = tk.Text(self.results_frame, wrap=tk.WORD, height=15)
-        report_text.pack(fill=tk.BOTH, expand=True)
-        report_text.insert(tk.END, report)
-        report_text.config(state=tk.DISABLED)
+        self.live_chart_visible = False
+        self._show_result(self.report_text)
+        self.report_text.config(state=tk.NORMAL)
+        self.report_text.delete('1.0', tk.END)
+        self.report_text.insert(tk.END, report or "")
+        self.report_text.config(state=tk.DISABLED)
         
     def visualize_data(self):
         """Visualize the selected log data"""
@@ -199,47 +325,43 @@ class HeadcountApp:
             messagebox.showwarning("No Log Selected", "Please select a log file to analyze.")
             return
             
-        # Clear previous results
-        for widget in self.results_frame.winfo_children():
-            widget.destroy()
-            
-        # Get analysis data
-        analysis = self.analyzer.analyze_log(selected_log)
+        # Get analysis data, downsampled for plotting
+        analysis = self.analyzer.analyze_for_plot(selected_log)
         if not analysis:
             messagebox.showerror("Analysis Error", "Could not analyze the selected log file.")
             return
             
-        # Create matplotlib figure
-        fig, ax = plt.subplots(figsize=(8, 4))
-        df = analysis['data']
-        stats = analysis['stats']
-        
-        # Plot data
-        ax.plot(df['timestamp'], df['count'], marker='o', linestyle='-', color='blue')
-        ax.axhline(y=stats['average_count'], color='r', linestyle='--', alpha=0.7, 
-                   label=f"Average: {stats['average_count']:.1f}")
-        
-        # Annotate peak
-        max_idx = df['count'].idxmax()
-        ax.annotate(f"Peak: {df['count'].max()}",
-                    xy=(df.loc[max_idx, 'timestamp'], df.loc[max_idx, 'count']),
-                    xytext=(10, 20),
-                    textcoords='offset points',
-                    arrowprops=dict(arrowstyle='->'))
-        
-        # Format plot
-        ax.set_title(f"Headcount Analysis - {os.path.basename(selected_log)}")
-        ax.set_xlabel("Time")
-        ax.set_ylabel("Number of People")
-        ax.grid(True, alpha=0.3)
-        ax.legend()
-        plt.xticks(rotation=45)
-        fig.tight_layout()
-        
-        # Embed in tkinter
-        canvas = FigureCanvasTkAgg(fig, self.results_frame)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        # Draw into the reused figure
+        self.live_chart_visible = False
+        self._show_result(self.chart.widget)
+        self.chart.show_analysis(self.analyzer, analysis, f"Headcount Analysis - {os.path.basename(selected_log)}")
+        
+    def show_live_chart(self):
+        """Show the live chart of the running detection session"""
+        if not self.detection_running:
+            messagebox.showinfo("No Detection Running", "Start a detection to see its live chart.")
+            return
+        
+        self.live_chart_visible = True
+        self._show_result(self.chart.widget)
+        self.chart.start_live(f"Live Headcount - {self.live_location}")
+        
+    def _queue_live_sample(self, result):
+        """Called on the detection pipeline's thread for every processed frame"""
+        self.live_samples.put((result.timestamp, result.count))
+        
+    def _poll_live_samples(self):
+        """Draw samples queued by the detection thread, on the UI thread"""
+        samples = []
+        while True:
+            try:
+                samples.append(self.live_samples.get_nowait())
+            except queue.Empty:
+                break
+        if samples:
+            # Kept even while the report or a log chart is shown
+            self.chart.add_samples(samples, draw=self.live_chart_visible)
+        self.root.after(LIVE_POLL_INTERVAL, self._poll_live_samples)
         
 # Run the application
 if __name__ == "__main__":
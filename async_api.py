@@ -0,0 +1,175 @@
+# async_api.py
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from quart import Quart, jsonify, request, Response
+from quart_cors import cors
+
+# The async server shares the detectors, store, scheduler and the rest of the
+# state with api.py, only the serving side differs
+import api
+from api import (
+    COALESCE_WINDOW, CORS_ORIGINS, store, camera_health, scheduler, degradation, due_room, sample_room,
+    immediate_answer, image_answer, count_capture, image_capture,
+    history_payload, heartbeat_payload, publish_payload, cluster_status_payload
+)
+from singleflight import AsyncSingleFlight
+
+# Threads for blocking camera and inference work. Captures are serialized per
+# camera anyway, so there is little point in many more threads than cameras.
+CAPTURE_WORKERS = max(4, 2 * len(api.ROOM_CAMERAS))
+
+app = cors(Quart(__name__), allow_origin=CORS_ORIGINS)
+
+capture_executor = ThreadPoolExecutor(max_workers=CAPTURE_WORKERS, thread_name_prefix='capture')
+
+# Waiting requests are coroutines, not threads blocked on the capture
+coalescer = AsyncSingleFlight(window=COALESCE_WINDOW)
+
+detection_task = None
+
+async def run_blocking(fn, *args):
+    """Run blocking capture or inference work in the capture threads"""
+    return await asyncio.get_running_loop().run_in_executor(capture_executor, fn, *args)
+
+# Background task to run detections for all cameras
+async def detection_worker():
+    while True:
+        room_id, wait = due_room()
+        if room_id is None:
+            await asyncio.sleep(wait)
+            continue
+
+        # Capture, inference and a possible profile switch all block
+        await run_blocking(sample_room, room_id)
+
+@app.before_serving
+async def start_detection_worker():
+    global detection_task
+    if not api.distributed:
+        detection_task = asyncio.create_task(detection_worker())
+
+@app.after_serving
+async def stop_detection_worker():
+    if detection_task is not None:
+        detection_task.cancel()
+
+# API endpoint to get headcount for a specific room
+@app.route('/api/headcount/<room_id>', methods=['GET'])
+async def get_room_headcount(room_id):
+    room_id = room_id.lower()
+    data = store.latest(room_id)
+    if data:
+        return jsonify(data)
+    else:
+        return jsonify({"error": f"Room {room_id} not found"}), 404
+
+# API endpoint to get headcount for all rooms
+@app.route('/api/headcount', methods=['GET'])
+async def get_all_headcount():
+    return jsonify(store.all_latest())
+
+# API endpoint to get recent headcount history for a room, served from memory
+# Optional ?since=<epoch seconds or YYYY-mm-dd HH:MM:SS> only returns newer samples
+@app.route('/api/headcount/<room_id>/history', methods=['GET'])
+async def get_room_history(room_id):
+    payload, status = history_payload(room_id.lower(), request.args.get('since'))
+    return jsonify(payload), status
+
+# API endpoint to get current headcount with image for a specific room
+# Optional ?max_staleness=<seconds> reuses a recent image capture for the room
+@app.route('/api/headcount/<room_id>/image', methods=['GET'])
+async def get_room_headcount_with_image(room_id):
+    room_id = room_id.lower()
+    answer = image_answer(room_id)
+    if answer:
+        payload, status, headers = answer
+        return jsonify(payload), status, headers
+
+    try:
+        # Get current count and image, shared with concurrent requests
+        key, capture, max_age = image_capture(room_id, request.args.get('max_staleness', type=float))
+        count, image_bytes = await coalescer.do(key, lambda: run_blocking(capture), max_age=max_age)
+
+        # Return the image
+        return Response(
+            image_bytes,
+            mimetype='image/jpeg',
+            headers={'Content-Disposition': f'inline; filename=headcount_{room_id}.jpg'}
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Immediate count endpoint (doesn't wait for background worker)
+# Optional ?max_staleness=<seconds> serves the background worker's latest
+# sample instead when it is at most that old
+@app.route('/api/headcount/<room_id>/immediate', methods=['GET'])
+async def get_immediate_headcount(room_id):
+    room_id = room_id.lower()
+    answer = immediate_answer(room_id, request.args.get('max_staleness', type=float))
+    if answer:
+        payload, status, headers = answer
+        return jsonify(payload), status, headers
+
+    try:
+        # Get current count, shared with concurrent requests for this room
+        key, capture, max_age = count_capture(room_id)
+        return jsonify(await coalescer.do(key, lambda: run_blocking(capture), max_age=max_age))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Health of every room's camera
+@app.route('/api/health/cameras', methods=['GET'])
+async def get_camera_health():
+    return jsonify(camera_health.all())
+
+# Health of a specific room's camera
+@app.route('/api/health/cameras/<room_id>', methods=['GET'])
+async def get_room_camera_health(room_id):
+    room_id = room_id.lower()
+    health = camera_health.get(room_id)
+    if health is None:
+        return jsonify({"error": f"Room {room_id} not found"}), 404
+    return jsonify(health)
+
+# Current sampling rate and priority of every room
+@app.route('/api/scheduler', methods=['GET'])
+async def get_scheduler_status():
+    return jsonify(scheduler.status())
+
+# Current degradation profile and the history of adjustments
+@app.route('/api/degradation', methods=['GET'])
+async def get_degradation_status():
+    return jsonify(degradation.status())
+
+# Worker node heartbeat, returns the rooms the worker should process
+@app.route('/api/cluster/heartbeat', methods=['POST'])
+async def cluster_heartbeat():
+    payload, status = heartbeat_payload(await request.get_json(silent=True) or {})
+    return jsonify(payload), status
+
+# Worker node publishing a count for a room it owns
+@app.route('/api/cluster/publish', methods=['POST'])
+async def cluster_publish():
+    payload, status = publish_payload(await request.get_json(silent=True) or {})
+    return jsonify(payload), status
+
+# Live worker nodes and their room assignments
+@app.route('/api/cluster/status', methods=['GET'])
+async def cluster_status():
+    payload, status = cluster_status_payload()
+    return jsonify(payload), status
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Headcount API server (asyncio/ASGI)")
+    parser.add_argument('--distributed', action='store_true',
+                        help="Only coordinate worker nodes (see cluster.py) instead of running local detection")
+    parser.add_argument('--host', default='0.0.0.0', help="Address to listen on")
+    parser.add_argument('--port', type=int, default=5000, help="Port to listen on")
+    args = parser.parse_args()
+    if args.distributed:
+        api.enable_distributed()
+
+    # Development server, use an ASGI server such as hypercorn in production
+    app.run(host=args.host, port=args.port)
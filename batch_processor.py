@@ -0,0 +1,187 @@
+# batch_processor.py
+import argparse
+import csv
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import multiprocessing
+
+import cv2
+
+from headcount import HeadcountDetector, limit_threads
+from log_catalog import LogCatalog
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.m4v', '.wmv')
+
+# Seeking jumps to the nearest keyframe and re-decodes from there, so for
+# short gaps it is cheaper to just grab (decode without converting) frames
+SEEK_THRESHOLD_FRAMES = 90
+
+# Each worker process loads its own model once and reuses it for every video
+_worker_detector = None
+
+
+def _init_worker(confidence, model_path, workers):
+    """Load the detector once per worker process"""
+    global _worker_detector
+    # Parallelism comes from the process pool, each worker gets its share of the cores
+    limit_threads(workers)
+    _worker_detector = HeadcountDetector(confidence=confidence, model_path=model_path)
+
+
+def find_videos(input_dir, recursive=False):
+    """Get a sorted list of video files in a directory"""
+    videos = []
+    if recursive:
+        for root, _, files in os.walk(input_dir):
+            videos.extend(os.path.join(root, f) for f in files)
+    else:
+        videos = [os.path.join(input_dir, f) for f in os.listdir(input_dir)]
+    return sorted(v for v in videos if v.lower().endswith(VIDEO_EXTENSIONS) and os.path.isfile(v))
+
+
+def guess_start_time(video_path, duration):
+    """Work out when a recording started
+
+    Uses a YYYYmmdd_HHMMSS stamp in the file name if there is one, otherwise
+    assumes the file was last modified when the recording finished.
+    """
+    match = re.search(r'(\d{8}_\d{6})', os.path.basename(video_path))
+    if match:
+        try:
+            return datetime.strptime(match.group(1), "%Y%m%d_%H%M%S")
+        except ValueError:
+            pass
+    return datetime.fromtimestamp(os.path.getmtime(video_path)) - timedelta(seconds=duration)
+
+
+def log_path_for(video_path, output_dir, start_time, location=None):
+    """Build the log file name in the same format the live detectors use"""
+    if location is None:
+        stem = os.path.splitext(os.path.basename(video_path))[0]
+        location = re.sub(r'_?\d{8}_\d{6}', '', stem) or stem
+    return os.path.join(output_dir, f'{location}_{start_time.strftime("%Y%m%d_%H%M%S")}.csv')
+
+
+def process_video(video_path, output_dir='data/logs', interval=5.0, location=None, detector=None):
+    """Count people in a recorded video, sampling one frame every `interval` seconds
+
+    Writes a timestamp,count log that HeadcountAnalyzer can read and returns a
+    summary dict for the video.
+    """
+    detector = detector or _worker_detector
+    if detector is None:
+        raise RuntimeError("No detector available, call from a worker process or pass one in")
+
+    started = time.time()
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise Exception(f"Could not open video {video_path}")
+
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        duration = total_frames / fps if total_frames > 0 else 0.0
+        start_time = guess_start_time(video_path, duration)
+
+        os.makedirs(output_dir, exist_ok=True)
+        log_file = log_path_for(video_path, output_dir, start_time, location)
+        # Write to a temporary name so half-finished logs never show up in the analyzer
+        tmp_file = log_file + '.part'
+
+        step = max(1, int(round(interval * fps)))
+        position = 0  # Index of the next frame the decoder will return
+        samples = 0
+
+        try:
+            with open(tmp_file, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['timestamp', 'count'])
+
+                target = 0
+                while total_frames <= 0 or target < total_frames:
+                    gap = target - position
+                    if gap > SEEK_THRESHOLD_FRAMES:
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+                    else:
+                        for _ in range(gap):
+                            if not cap.grab():
+                                break
+
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    position = target + 1
+
+                    count = detector.count_people(frame)
+                    timestamp = start_time + timedelta(seconds=target / fps)
+                    writer.writerow([timestamp.strftime("%Y-%m-%d %H:%M:%S"), count])
+                    samples += 1
+                    target += step
+
+            os.replace(tmp_file, log_file)
+        except BaseException:
+            # Don't leave a half-written log behind
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+    finally:
+        cap.release()
+
+    return {
+        'video': video_path,
+        'log_file': log_file,
+        'samples': samples,
+        'duration': duration,
+        'elapsed': time.time() - started,
+    }
+
+
+def process_directory(input_dir, output_dir='data/logs', interval=5.0, workers=None,
+                      confidence=0.5, model_path='yolov8n.pt', recursive=False):
+    """Process every video in a directory in parallel worker processes"""
+    videos = find_videos(input_dir, recursive)
+    if not videos:
+        print(f"No video files found in {input_dir}")
+        return []
+
+    workers = workers or os.cpu_count() or 1
+    workers = min(workers, len(videos))
+    print(f"Processing {len(videos)} videos with {workers} worker processes")
+
+    results = []
+    # Spawn keeps each worker's model and OpenCV state independent of the parent
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(confidence, model_path, workers)) as pool:
+        futures = {pool.submit(process_video, v, output_dir, interval): v for v in videos}
+        for future in as_completed(futures):
+            video = futures[future]
+            try:
+                result = future.result()
+                results.append(result)
+                print(f"{os.path.basename(video)}: {result['samples']} samples "
+                      f"in {result['elapsed']:.1f}s -> {result['log_file']}")
+            except Exception as e:
+                print(f"Error processing {video}: {str(e)}")
+
+    # Make the new logs show up in listings straight away
+    LogCatalog(output_dir).refresh(force=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Count people in recorded lecture videos")
+    parser.add_argument('input_dir', help="Directory containing video files")
+    parser.add_argument('--output-dir', default='data/logs', help="Where to write the headcount logs")
+    parser.add_argument('--interval', type=float, default=5.0, help="Seconds of video between samples")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument('--confidence', type=float, default=0.5, help="Detection confidence threshold")
+    parser.add_argument('--model', default='yolov8n.pt', help="YOLO model weights to use")
+    parser.add_argument('--recursive', action='store_true', help="Also search subdirectories")
+    args = parser.parse_args()
+
+    process_directory(args.input_dir, args.output_dir, args.interval, args.workers,
+                      args.confidence, args.model, args.recursive)
@@ -0,0 +1,132 @@
+# bulk_report.py
+import argparse
+import html
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from analyzer import HeadcountAnalyzer, MAX_PLOT_POINTS
+from log_format import parse_log_name
+
+
+def _json_value(value):
+    """Make numpy and pandas values from the stats JSON serializable"""
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+def render_log(logs_dir, log_file, output_dir, max_points=MAX_PLOT_POINTS):
+    """Write the text report and chart for one log, returning its index entry
+
+    Runs in a worker process and only uses object-oriented figures, never the
+    pyplot state machine.
+    """
+    analyzer = HeadcountAnalyzer(logs_dir)
+    stem = os.path.splitext(log_file)[0]
+    room, started = parse_log_name(log_file)
+
+    # One read of the log serves both the report and the chart
+    analysis = analyzer.analyze_for_plot(log_file, max_points)
+    if not analysis:
+        raise Exception(f"Could not analyze {log_file}")
+
+    report_file = f"{stem}.txt"
+    with open(os.path.join(output_dir, report_file), 'w') as f:
+        f.write(analyzer.format_report(log_file, analysis['stats']))
+
+    chart_file = f"{stem}.png"
+    fig = analyzer.render_figure(log_file, analysis=analysis)
+    fig.savefig(os.path.join(output_dir, chart_file))
+
+    return {
+        'log_file': log_file,
+        'room': room,
+        'started': started.isoformat() if started else None,
+        'report': report_file,
+        'chart': chart_file,
+        'stats': {key: _json_value(value) for key, value in analysis['stats'].items()},
+    }
+
+
+def write_index(output_dir, entries, errors):
+    """Write index.json and a browsable index.html grouped by room"""
+    entries = sorted(entries, key=lambda e: (e['room'], e['started'] or '', e['log_file']))
+    generated = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    with open(os.path.join(output_dir, 'index.json'), 'w') as f:
+        json.dump({'generated': generated, 'reports': entries, 'errors': errors}, f, indent=2)
+
+    rows = []
+    current_room = None
+    for entry in entries:
+        if entry['room'] != current_room:
+            current_room = entry['room']
+            rows.append(f"<h2>{html.escape(current_room)}</h2>")
+        stats = entry['stats']
+        rows.append(
+            f"<p><a href=\"{html.escape(entry['chart'])}\"><img src=\"{html.escape(entry['chart'])}\" width=\"480\"></a><br>"
+            f"<a href=\"{html.escape(entry['report'])}\">{html.escape(entry['log_file'])}</a> - "
+            f"average {stats['average_count']:.2f}, peak {stats['max_count']} at {html.escape(str(stats['peak_time']))}</p>"
+        )
+    for error in errors:
+        rows.append(f"<p>Failed: {html.escape(error['log_file'])} - {html.escape(error['error'])}</p>")
+
+    with open(os.path.join(output_dir, 'index.html'), 'w') as f:
+        f.write(
+            "<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>Headcount Reports</title></head><body>\n"
+            f"<h1>Headcount Reports</h1>\n<p>Generated {generated}</p>\n"
+            + "\n".join(rows)
+            + "\n</body></html>\n"
+        )
+
+
+def generate_bulk_reports(logs_dir='data/logs', output_dir='data/reports', rooms=None, workers=None,
+                          max_points=MAX_PLOT_POINTS):
+    """Render reports and charts for many logs in parallel worker processes
+
+    rooms limits the run to logs whose location is in the list. Returns the
+    list of index entries.
+    """
+    logs = HeadcountAnalyzer(logs_dir).get_available_logs()
+    if rooms:
+        logs = [log for log in logs if parse_log_name(log)[0] in rooms]
+    if not logs:
+        print("No log files found")
+        return []
+
+    os.makedirs(output_dir, exist_ok=True)
+    workers = min(workers or os.cpu_count() or 1, len(logs))
+    print(f"Generating reports for {len(logs)} logs with {workers} worker processes")
+
+    entries = []
+    errors = []
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = {pool.submit(render_log, logs_dir, log, output_dir, max_points): log for log in logs}
+        for future in as_completed(futures):
+            log = futures[future]
+            try:
+                entries.append(future.result())
+            except Exception as e:
+                print(f"Error generating report for {log}: {str(e)}")
+                errors.append({'log_file': log, 'error': str(e)})
+
+    write_index(output_dir, entries, errors)
+    print(f"Reports written to {output_dir}")
+    return entries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate reports and charts for many headcount logs")
+    parser.add_argument('--logs-dir', default='data/logs', help="Directory containing the logs")
+    parser.add_argument('--output-dir', default='data/reports', help="Where to write reports, charts and the index")
+    parser.add_argument('--room', action='append', dest='rooms', help="Only include this room (can be repeated)")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    generate_bulk_reports(args.logs_dir, args.output_dir, args.rooms, args.workers)
@@ -0,0 +1,167 @@
+# camera_health.py
+import threading
+import time
+
+# Circuit states
+HEALTHY = 'healthy'        # Working, sampled normally
+DEGRADED = 'degraded'      # Failed recently, retried after a short backoff
+OPEN = 'open'              # Too many failures in a row, skipped until the backoff expires
+HALF_OPEN = 'half_open'    # Backoff expired, the next attempt is a probe
+
+class CameraTimeout(Exception):
+    """A camera call did not finish in time"""
+
+# Calls that timed out but are still stuck inside OpenCV, by camera
+_abandoned = {}
+_abandoned_lock = threading.Lock()
+
+def stuck_call(key):
+    """Whether an abandoned call for this camera is still running"""
+    with _abandoned_lock:
+        done = _abandoned.get(key)
+        return done is not None and not done.is_set()
+
+def call_with_timeout(fn, timeout, on_late_result=None, key=None):
+    """Run fn() and give up after `timeout` seconds
+
+    OpenCV calls cannot be interrupted, so a call that times out keeps running
+    on an abandoned daemon thread. If it finishes later its result is handed to
+    on_late_result (e.g. to release a capture that opened too late). With a
+    key (the camera), later calls fail straight away while an abandoned call
+    for that camera is still stuck, instead of leaking another thread and
+    capture on every retry.
+    """
+    if timeout is None:
+        return fn()
+    if key is not None and stuck_call(key):
+        raise CameraTimeout(f"Camera {key} is still stuck in an earlier call")
+
+    lock = threading.Lock()
+    done = threading.Event()
+    state = {'abandoned': False}
+
+    def target():
+        try:
+            state['result'] = fn()
+        except Exception as e:
+            state['error'] = e
+        with lock:
+            late = state['abandoned']
+            done.set()
+        if late:
+            with _abandoned_lock:
+                if _abandoned.get(key) is done:
+                    del _abandoned[key]
+            if on_late_result is not None and 'result' in state:
+                on_late_result(state['result'])
+
+    threading.Thread(target=target, daemon=True).start()
+
+    finished = done.wait(timeout)
+    with lock:
+        if not done.is_set():
+            state['abandoned'] = True
+            if key is not None:
+                with _abandoned_lock:
+                    _abandoned[key] = done
+    if not finished and state['abandoned']:
+        raise CameraTimeout(f"Camera call timed out after {timeout}s")
+    if 'error' in state:
+        raise state['error']
+    return state.get('result')
+
+class CameraHealth:
+    def __init__(self, camera_id, failure_threshold=3, base_backoff=5, max_backoff=300):
+        """Health and circuit breaker state for one camera
+
+        Each failure in a row doubles the wait before the camera is tried
+        again, up to max_backoff. After failure_threshold failures the circuit
+        opens and the camera is skipped until its backoff expires.
+        """
+        self.camera_id = camera_id
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.state = HEALTHY
+        self.consecutive_failures = 0
+        self.total_failures = 0
+        self.total_successes = 0
+        self.last_error = None
+        self.last_success = None
+        self.last_failure = None
+        self.last_latency = None
+        self.next_attempt = 0
+
+    def ready(self, now=None):
+        """Whether the camera should be tried now"""
+        now = time.time() if now is None else now
+        if now < self.next_attempt:
+            return False
+        if self.state == OPEN:
+            self.state = HALF_OPEN
+        return True
+
+    def record_success(self, latency=None):
+        self.state = HEALTHY
+        self.consecutive_failures = 0
+        self.total_successes += 1
+        self.last_success = time.time()
+        self.last_latency = latency
+        self.next_attempt = 0
+
+    def record_failure(self, error):
+        now = time.time()
+        self.consecutive_failures += 1
+        self.total_failures += 1
+        self.last_error = str(error)
+        self.last_failure = now
+
+        backoff = min(self.max_backoff, self.base_backoff * 2 ** (self.consecutive_failures - 1))
+        self.next_attempt = now + backoff
+        self.state = OPEN if self.consecutive_failures >= self.failure_threshold else DEGRADED
+
+    def retry_after(self):
+        """Seconds until the camera will be tried again"""
+        return max(0.0, self.next_attempt - time.time())
+
+    def to_dict(self):
+        return {
+            "camera_id": self.camera_id,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "total_failures": self.total_failures,
+            "total_successes": self.total_successes,
+            "last_error": self.last_error,
+            "last_success": self.last_success,
+            "last_failure": self.last_failure,
+            "last_latency": self.last_latency,
+            "retry_after": self.retry_after(),
+        }
+
+class CameraHealthRegistry:
+    def __init__(self, cameras, **health_options):
+        """Thread-safe health state for a map of room IDs to camera IDs"""
+        self._lock = threading.Lock()
+        self._health = {room_id: CameraHealth(camera_id, **health_options) for room_id, camera_id in cameras.items()}
+
+    def ready(self, room_id):
+        with self._lock:
+            return self._health[room_id].ready()
+
+    def record_success(self, room_id, latency=None):
+        with self._lock:
+            self._health[room_id].record_success(latency)
+
+    def record_failure(self, room_id, error):
+        with self._lock:
+            self._health[room_id].record_failure(error)
+
+    def get(self, room_id):
+        """Health of one room's camera as a dict, or None for unknown rooms"""
+        with self._lock:
+            health = self._health.get(room_id)
+            return health.to_dict() if health else None
+
+    def all(self):
+        with self._lock:
+            return {room_id: health.to_dict() for room_id, health in self._health.items()}
@@ -0,0 +1,254 @@
+# cluster.py
+import argparse
+import bisect
+import hashlib
+import json
+import socket
+import threading
+import time
+import urllib.request
+import urllib.error
+
+# Workers that have not sent a heartbeat for this many seconds lose their rooms
+HEARTBEAT_TIMEOUT = 15
+HEARTBEAT_INTERVAL = 5
+
+# Seconds a worker waits for a camera to open or return a frame before giving up
+CAMERA_OPEN_TIMEOUT = 10
+CAMERA_READ_TIMEOUT = 5
+
+def load_classrooms(config_path='config/classrooms.json'):
+    """Map of room ID (lowercase, like the API's) to camera URL from the classrooms config"""
+    with open(config_path) as f:
+        config = json.load(f)
+    return {room['id'].lower(): room['camera_url'] for room in config['classrooms']}
+
+class HashRing:
+    def __init__(self, nodes=(), replicas=100):
+        """Consistent hash ring, adding or removing a node only moves its share of keys"""
+        self.replicas = replicas
+        self._keys = []
+        self._nodes = {}
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(value):
+        return int(hashlib.md5(value.encode('utf-8')).hexdigest(), 16)
+
+    def add(self, node):
+        for i in range(self.replicas):
+            key = self._hash(f"{node}#{i}")
+            self._nodes[key] = node
+            bisect.insort(self._keys, key)
+
+    def remove(self, node):
+        for i in range(self.replicas):
+            key = self._hash(f"{node}#{i}")
+            if self._nodes.pop(key, None) is not None:
+                self._keys.remove(key)
+
+    def lookup(self, item):
+        """Node that owns an item, or None if the ring is empty"""
+        if not self._keys:
+            return None
+        index = bisect.bisect(self._keys, self._hash(item)) % len(self._keys)
+        return self._nodes[self._keys[index]]
+
+class Coordinator:
+    def __init__(self, rooms, store, heartbeat_timeout=HEARTBEAT_TIMEOUT):
+        """Hands out rooms to live worker nodes and collects their counts
+
+        Room IDs are matched case-insensitively and stored lowercase.
+        """
+        self.rooms = [room_id.lower() for room_id in rooms]
+        self.store = store
+        self.heartbeat_timeout = heartbeat_timeout
+        self._lock = threading.Lock()
+        self._last_seen = {}
+        self._ring = HashRing()
+        self._assignments = {}
+
+    def _expire(self):
+        """Drop workers whose heartbeats stopped, must hold the lock"""
+        now = time.time()
+        dead = [w for w, seen in self._last_seen.items() if now - seen > self.heartbeat_timeout]
+        for worker_id in dead:
+            print(f"Worker {worker_id} missed its heartbeats, rebalancing its rooms")
+            del self._last_seen[worker_id]
+            self._ring.remove(worker_id)
+        if dead:
+            self._rebalance()
+
+    def _rebalance(self):
+        """Recompute which worker owns each room, must hold the lock"""
+        self._assignments = {room_id: self._ring.lookup(room_id) for room_id in self.rooms}
+
+    def heartbeat(self, worker_id):
+        """Record a heartbeat and return the rooms the worker should process"""
+        with self._lock:
+            if worker_id not in self._last_seen:
+                print(f"Worker {worker_id} joined, rebalancing rooms")
+                self._ring.add(worker_id)
+                self._last_seen[worker_id] = time.time()
+                self._rebalance()
+            self._last_seen[worker_id] = time.time()
+            self._expire()
+            return [room_id for room_id, owner in self._assignments.items() if owner == worker_id]
+
+    def publish(self, worker_id, room_id, count, timestamp=None):
+        """Store a count from a worker, returns False if the worker does not own the room"""
+        room_id = room_id.lower()
+        with self._lock:
+            self._expire()
+            if self._assignments.get(room_id) != worker_id:
+                return False
+        self.store.update(room_id, count, timestamp)
+        return True
+
+    def status(self):
+        """Live workers with their last heartbeat and assigned rooms"""
+        with self._lock:
+            self._expire()
+            return {
+                worker_id: {
+                    "last_seen": seen,
+                    "rooms": [r for r, owner in self._assignments.items() if owner == worker_id],
+                }
+                for worker_id, seen in self._last_seen.items()
+            }
+
+class LocalTransport:
+    def __init__(self, coordinator):
+        """In-process stand-in for HttpTransport, for tests and single-box setups"""
+        self.coordinator = coordinator
+
+    def heartbeat(self, worker_id):
+        return self.coordinator.heartbeat(worker_id)
+
+    def publish(self, worker_id, room_id, count, timestamp):
+        return self.coordinator.publish(worker_id, room_id, count, timestamp)
+
+class HttpTransport:
+    def __init__(self, base_url, timeout=5):
+        """Talks to the coordinator endpoints of an API node over JSON/HTTP"""
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def _post(self, path, payload):
+        request = urllib.request.Request(
+            f"{self.base_url}{path}",
+            data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST'
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            return json.loads(e.read().decode('utf-8') or '{}')
+
+    def heartbeat(self, worker_id):
+        return self._post('/api/cluster/heartbeat', {"worker_id": worker_id})["rooms"]
+
+    def publish(self, worker_id, room_id, count, timestamp):
+        response = self._post('/api/cluster/publish', {
+            "worker_id": worker_id,
+            "room_id": room_id,
+            "count": count,
+            "timestamp": timestamp,
+        })
+        return response.get("accepted", False)
+
+def _default_detector_factory(camera_url):
+    from headcount import HeadcountDetector
+    return HeadcountDetector(camera_id=camera_url, confidence=0.5,
+                             open_timeout=CAMERA_OPEN_TIMEOUT, read_timeout=CAMERA_READ_TIMEOUT)
+
+class WorkerNode:
+    def __init__(self, worker_id, transport, cameras, sample_interval=5,
+                 heartbeat_interval=HEARTBEAT_INTERVAL, detector_factory=_default_detector_factory):
+        """Detection node that processes whichever rooms the coordinator assigns it
+
+        cameras maps room IDs to the camera URL as seen from this node.
+        Heartbeats are sent from their own thread, so a slow or hanging camera
+        doesn't make the coordinator think the whole node is gone.
+        """
+        self.worker_id = worker_id
+        self.transport = transport
+        self.cameras = cameras
+        self.sample_interval = sample_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.detector_factory = detector_factory
+        self.rooms = []
+        self.detectors = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def heartbeat(self):
+        """Send a heartbeat and pick up the current room assignment"""
+        rooms = self.transport.heartbeat(self.worker_id)
+        with self._lock:
+            if set(rooms) != set(self.rooms):
+                print(f"Worker {self.worker_id} now owns rooms: {', '.join(sorted(rooms)) or 'none'}")
+            # Release detectors for rooms that moved to another worker
+            for room_id in set(self.detectors) - set(rooms):
+                del self.detectors[room_id]
+            self.rooms = rooms
+
+    def _heartbeat_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.heartbeat()
+            except Exception as e:
+                print(f"Worker {self.worker_id} could not reach the coordinator: {str(e)}")
+            self._stop.wait(self.heartbeat_interval)
+
+    def process_rooms(self):
+        """Count every owned room once and publish the results"""
+        with self._lock:
+            rooms = list(self.rooms)
+        for room_id in rooms:
+            if self._stop.is_set():
+                break
+            with self._lock:
+                if room_id not in self.rooms:
+                    # Moved to another worker during this sweep
+                    continue
+                detector = self.detectors.get(room_id)
+            try:
+                if detector is None:
+                    detector = self.detector_factory(self.cameras[room_id])
+                    with self._lock:
+                        self.detectors[room_id] = detector
+                count = detector.get_current_count()
+                if not self.transport.publish(self.worker_id, room_id, count, time.time()):
+                    # The room was reassigned since our last heartbeat
+                    with self._lock:
+                        if room_id in self.rooms:
+                            self.rooms.remove(room_id)
+            except Exception as e:
+                print(f"Error processing room {room_id}: {str(e)}")
+
+    def run(self):
+        """Heartbeat and process owned rooms until stopped"""
+        heartbeats = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        heartbeats.start()
+        while not self._stop.is_set():
+            self.process_rooms()
+            self._stop.wait(self.sample_interval)
+        heartbeats.join()
+
+    def stop(self):
+        self._stop.set()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a headcount detection worker node")
+    parser.add_argument('--api', default='http://localhost:5000', help="URL of the API node running the coordinator")
+    parser.add_argument('--id', default=socket.gethostname(), help="Unique ID of this worker node")
+    parser.add_argument('--config', default='config/classrooms.json', help="Classrooms config with camera URLs")
+    parser.add_argument('--interval', type=float, default=5, help="Seconds between sweeps of the owned rooms")
+    args = parser.parse_args()
+
+    worker = WorkerNode(args.id, HttpTransport(args.api), load_classrooms(args.config), args.interval)
+    worker.run()
@@ -0,0 +1,117 @@
+# degradation.py
+import os
+import threading
+import time
+from collections import deque
+
+# Quality levels from best to cheapest. rate_factor scales the sampling budget.
+PROFILES = [
+    {"name": "full", "model": "yolov8s.pt", "imgsz": 640, "rate_factor": 1.0},
+    {"name": "standard", "model": "yolov8n.pt", "imgsz": 640, "rate_factor": 1.0},
+    {"name": "reduced", "model": "yolov8n.pt", "imgsz": 480, "rate_factor": 0.75},
+    {"name": "minimal", "model": "yolov8n.pt", "imgsz": 320, "rate_factor": 0.5},
+]
+
+# The profile HeadcountDetector uses out of the box
+DEFAULT_LEVEL = 1
+
+def cpu_load():
+    """1-minute load average per CPU, or None where it isn't available"""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return None
+
+class DegradationController:
+    def __init__(self, latency_target=2.0, profiles=PROFILES, start_level=DEFAULT_LEVEL,
+                 cpu_high=0.9, cpu_low=0.5, window=20, cooldown=30, on_change=None, best_level=None):
+        """Steps model, input size and sampling rate down or up to meet a latency target
+
+        Feed it every sample's inference time and loop lag (how late the
+        sample ran) with observe(). Only inference is timed, opening and
+        reading the camera doesn't get faster with a cheaper profile. When the recent p90 of
+        latency + lag is above the target, or the CPU is saturated, it moves to
+        a cheaper profile. When there is plenty of headroom it moves back up,
+        but never past best_level (start_level unless given), so heavier
+        profiles like "full" are only used when asked for.
+        on_change(profile) is called after every adjustment.
+        """
+        self.latency_target = latency_target
+        self.profiles = profiles
+        self.level = start_level
+        self.best_level = start_level if best_level is None else best_level
+        self.cpu_high = cpu_high
+        self.cpu_low = cpu_low
+        self.cooldown = cooldown
+        self.on_change = on_change
+
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)
+        self._last_change = time.time()
+        self.adjustments = deque(maxlen=100)
+
+    @property
+    def profile(self):
+        return self.profiles[self.level]
+
+    def observe(self, latency, lag=0.0):
+        """Record one sample's inference time and loop lag (seconds)"""
+        with self._lock:
+            self._samples.append(latency + lag)
+
+    def _recent_p90(self):
+        samples = sorted(self._samples)
+        return samples[int(0.9 * (len(samples) - 1))]
+
+    def evaluate(self, now=None):
+        """Adjust the profile if needed, returns the new profile or None"""
+        now = time.time() if now is None else now
+        with self._lock:
+            if now - self._last_change < self.cooldown or len(self._samples) < self._samples.maxlen // 2:
+                return None
+
+            p90 = self._recent_p90()
+            load = cpu_load()
+            if (p90 > self.latency_target or (load is not None and load > self.cpu_high)) \
+                    and self.level < len(self.profiles) - 1:
+                step = 1
+                reason = f"p90 {p90:.2f}s over target {self.latency_target:.2f}s" if p90 > self.latency_target \
+                    else f"CPU load {load:.2f} over {self.cpu_high:.2f}"
+            elif p90 < self.latency_target * 0.5 and (load is None or load < self.cpu_low) \
+                    and self.level > self.best_level:
+                step = -1
+                reason = f"p90 {p90:.2f}s well under target {self.latency_target:.2f}s"
+            else:
+                return None
+
+            previous = self.profile
+            self.level += step
+            self._last_change = now
+            # Measurements from the old profile don't describe the new one
+            self._samples.clear()
+            adjustment = {
+                "time": now,
+                "from": previous["name"],
+                "to": self.profile["name"],
+                "reason": reason,
+                "cpu_load": load,
+            }
+            self.adjustments.append(adjustment)
+            profile = self.profile
+
+        print(f"Degradation: {adjustment['from']} -> {adjustment['to']} ({reason})")
+        if self.on_change:
+            self.on_change(profile)
+        return profile
+
+    def status(self):
+        with self._lock:
+            return {
+                "profile": self.profile,
+                "level": self.level,
+                "best_level": self.best_level,
+                "latency_target": self.latency_target,
+                "recent_p90": self._recent_p90() if self._samples else None,
+                "cpu_load": cpu_load(),
+                "adjustments": list(self.adjustments),
+            }
@@ -0,0 +1,72 @@
+# frame_slot.py
+import threading
+import cv2
+from pipeline import draw_detections
+
+
+class _Entry:
+    def __init__(self, version, timestamp, frame, boxes, count):
+        """One published frame, never modified after it is published"""
+        self.version = version
+        self.timestamp = timestamp
+        self.frame = frame
+        self.boxes = boxes
+        self.count = count
+
+
+class FrameSlot:
+    def __init__(self, jpeg_quality=95):
+        """Latest raw frame and its detections, annotated only when someone asks
+
+        The pipeline publishes into the back buffer and flips it to the front,
+        so publishing never copies or draws on the frame. Annotation and JPEG
+        encoding happen on the first request for a frame version and are cached
+        for every later request of the same version.
+        """
+        self.jpeg_quality = jpeg_quality
+        self._buffers = [None, None]
+        self._front = 0
+        self._version = 0
+        self._lock = threading.Lock()
+        self._encode_lock = threading.Lock()
+        self._encoded_version = None
+        self._encoded = None
+
+    def publish(self, result):
+        """Store a pipeline FrameResult as the latest frame"""
+        back = 1 - self._front
+        self._buffers[back] = _Entry(self._version + 1, result.timestamp, result.frame, result.boxes, result.count)
+        with self._lock:
+            self._front = back
+            self._version += 1
+
+    def clear(self):
+        """Forget the current frame, e.g. when a new session starts"""
+        with self._lock:
+            self._buffers = [None, None]
+            self._version += 1
+
+    def latest(self):
+        """The latest published entry, or None"""
+        with self._lock:
+            return self._buffers[self._front]
+
+    @property
+    def count(self):
+        entry = self.latest()
+        return entry.count if entry else 0
+
+    def jpeg(self):
+        """Annotated JPEG bytes and count of the latest frame, or (None, 0)"""
+        entry = self.latest()
+        if entry is None:
+            return None, 0
+
+        with self._encode_lock:
+            if self._encoded_version != entry.version:
+                # Draw on a copy so the raw frame stays untouched
+                frame = draw_detections(entry.frame.copy(), entry.boxes, entry.count)
+                _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+                self._encoded = buffer.tobytes()
+                self._encoded_version = entry.version
+            return self._encoded, entry.count
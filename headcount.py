@@ -110,206 +110,154 @@ import numpy as np
 from ultralytics import YOLO
 from datetime import datetime
 import os
-import csv
-import time
+from pipeline import Pipeline, CameraSource, CsvLogSink, DisplaySink, CollectSink, BLOCK
+from log_catalog import LogCatalog
+
+def limit_threads(processes):
+    """Share the cores between `processes` worker processes running side by side
+
+    PyTorch and OpenCV each use every core by default, which for several
+    workers means many times more threads than cores fighting over the CPU.
+    """
+    # Installed with ultralytics, only needed by worker processes
+    import torch
+    threads = max(1, (os.cpu_count() or 1) // processes)
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(threads)
 
 class HeadcountDetector:
-    def __init__(self, camera_id=0, confidence=0.5):
+    def __init__(self, camera_id=0, confidence=0.5, model_path='yolov8n.pt', open_timeout=None, read_timeout=None,
+                 imgsz=640):
         """Initialize the headcount detector with laptop camera"""
         self.camera_id = camera_id
         self.confidence = confidence
+        # Seconds to wait for the camera before giving up (None waits forever)
+        self.open_timeout = open_timeout
+        self.read_timeout = read_timeout
         # Load YOLOv8 model (downloads automatically if not present)
-        self.model = YOLO('yolov8n.pt')  # Nano model for speed
+        self.model = YOLO(model_path)  # Nano model by default for speed
+        self.model_path = model_path
+        # Input size the model runs at, smaller is faster but misses small people
+        self.imgsz = imgsz
+        # Pipeline of the running run_detection session, if any
+        self.pipeline = None
         # Ensure logs directory exists
         os.makedirs('data/logs', exist_ok=True)
-        
-    def run_detection(self, location_name="Classroom", save_interval=5):
-        """Run the headcount detection on webcam feed"""
-        # Initialize video capture from webcam
-        cap = cv2.VideoCapture(self.camera_id)
-        
-        if not cap.isOpened():
-            print("Error: Could not access webcam")
-            return
-            
-        # Prepare for logging
+
+    def detect(self, frame):
+        """Run the model on a frame and return (person_count, boxes)
+
+        boxes is an (N, 5) float32 array of x1, y1, x2, y2, confidence for
+        every person above the confidence threshold.
+        """
+        results = self.model(frame, imgsz=self.imgsz, verbose=False)
+
+        detections = []
+        for result in results:
+            boxes = result.boxes.cpu().numpy()
+            # Persons are class 0 in the COCO dataset
+            mask = (boxes.cls == 0) & (boxes.conf > self.confidence)
+            detections.append(np.hstack([boxes.xyxy[mask], boxes.conf[mask, None]]))
+
+        boxes = np.vstack(detections).astype(np.float32) if detections else np.zeros((0, 5), np.float32)
+        return len(boxes), boxes
+
+    def set_profile(self, model_path=None, imgsz=None):
+        """Switch model weights and/or input size at runtime"""
+        if model_path and model_path != self.model_path:
+            # Load first, then swap, so detections in flight keep the old model
+            model = YOLO(model_path)
+            self.model = model
+            self.model_path = model_path
+        if imgsz:
+            self.imgsz = imgsz
+
+    def count_people(self, frame):
+        """Count the people in a single frame without drawing on it"""
+        return self.detect(frame)[0]
+
+    def run_detection(self, location_name="Classroom", save_interval=5, sinks=(), change_only=False, catalog=None):
+        """Run the headcount detection on webcam feed
+
+        Extra pipeline sinks can be passed in to receive every result. With
+        change_only the log only gets a row when the count changes (plus
+        periodic heartbeat rows). The logs' LogCatalog (a new one unless passed
+        as catalog) is kept up to date as the log is written.
+        """
         log_file = f'data/logs/{location_name}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        with open(log_file, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(['timestamp', 'count'])
-        
-        print(f"Starting headcount detection for {location_name}")
-        print("Press 'q' to quit")
-        
-        frame_count = 0
-        
-        while True:
-            # Read frame from webcam
-            ret, frame = cap.read()
-            if not ret:
-                print("Failed to capture frame from camera")
-                break
-                
-            frame_count += 1
-            
-            # Only process every few frames to reduce CPU usage
-            if frame_count % 3 == 0:
-                # Run detection
-                results = self.model(frame)
-                
-                # Count persons (class 0 in COCO dataset)
-                person_count = 0
-                for result in results:
-                    boxes = result.boxes
-                    for box in boxes:
-                        cls = int(box.cls[0])
-                        conf = float(box.conf[0])
-                        
-                        # Filter for persons with confidence > threshold
-                        if cls == 0 and conf > self.confidence:
-                            person_count += 1
-                            
-                            # Draw bounding box
-                            x1, y1, x2, y2 = map(int, box.xyxy[0])
-                            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                
-                # Add count text to frame
-                cv2.putText(
-                    frame, 
-                    f"People Count: {person_count}", 
-                    (10, 30), 
-                    cv2.FONT_HERSHEY_SIMPLEX, 
-                    1, 
-                    (0, 0, 255), 
-                    2
-                )
-                
-                # Log count at regular intervals
-                if frame_count % (save_interval * 30) == 0:  # Approx every 'save_interval' seconds
-                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    with open(log_file, 'a', newline='') as f:
-                        writer = csv.writer(f)
-                        writer.writerow([timestamp, person_count])
-                    print(f"{timestamp}: Detected {person_count} people")
-            
-            # Display the frame
-            cv2.imshow("University Headcount System", frame)
-            
-            # Break loop if 'q' is pressed
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
-                
-        # Clean up
-        cap.release()
-        cv2.destroyAllWindows()
-        print(f"Headcount session ended. Log saved to {log_file}")
-        return log_file
-    
-    def get_current_count(self):
+        own_catalog = catalog is None
+        if own_catalog:
+            catalog = LogCatalog(os.path.dirname(log_file))
+
+        # Only process every few frames to reduce CPU usage
+        pipeline = Pipeline(
+            CameraSource(self.camera_id, process_every=3,
+                         open_timeout=self.open_timeout, read_timeout=self.read_timeout),
+            self,
+            [CsvLogSink(log_file, save_interval, change_only=change_only, catalog=catalog), DisplaySink(), *sinks],
+            annotate=True
+        )
+        self.pipeline = pipeline
+
+        try:
+            try:
+                pipeline.start()
+            except Exception:
+                print("Error: Could not access webcam")
+                return
+
+            print(f"Starting headcount detection for {location_name}")
+            print("Press 'q' to quit")
+
+            pipeline.join()
+            print(f"Headcount session ended. Log saved to {log_file}")
+            return log_file
+        finally:
+            if own_catalog:
+                catalog.close()
+
+    def stop_detection(self):
+        """Stop a running run_detection session"""
+        if self.pipeline is not None:
+            self.pipeline.stop()
+
+    def _capture_once(self, annotate=False, sinks=()):
+        """Run the pipeline on a single frame and return its result"""
+        collector = CollectSink()
+        pipeline = Pipeline(
+            # Try to read a few frames to stabilize camera
+            CameraSource(self.camera_id, warmup=3, max_frames=1,
+                         open_timeout=self.open_timeout, read_timeout=self.read_timeout),
+            self,
+            [collector, *sinks],
+            annotate=annotate,
+            drop_policy=BLOCK
+        )
+        pipeline.run()
+        return collector.results[0]
+
+    def get_current_count(self, sinks=()):
         """Get the current headcount from a single frame without displaying UI"""
-        # Initialize video capture
-        cap = cv2.VideoCapture(self.camera_id)
-        
-        if not cap.isOpened():
-            raise Exception(f"Could not access camera {self.camera_id}")
-        
-        # Try to read a few frames to stabilize camera
-        for _ in range(3):
-            ret, _ = cap.read()
-            if not ret:
-                time.sleep(0.1)
-        
-        # Read a frame for detection
-        ret, frame = cap.read()
-        if not ret:
-            cap.release()
-            raise Exception("Failed to capture frame from camera")
-        
-        # Run detection
-        results = self.model(frame)
-        
-        # Count persons (class 0 in COCO dataset)
-        person_count = 0
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                cls = int(box.cls[0])
-                conf = float(box.conf[0])
-                
-                # Filter for persons with confidence > threshold
-                if cls == 0 and conf > self.confidence:
-                    person_count += 1
-        
-        # Clean up
-        cap.release()
-        
+        person_count = self._capture_once(sinks=sinks).count
+
         # Log to console
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         print(f"{timestamp}: API detection - {person_count} people on camera {self.camera_id}")
-        
+
         return person_count
-    
-    def get_current_count_with_image(self):
+
+    def get_current_count_with_image(self, sinks=()):
         """Get the current headcount and return the annotated image as bytes"""
-        # Initialize video capture
-        cap = cv2.VideoCapture(self.camera_id)
-        
-        if not cap.isOpened():
-            raise Exception(f"Could not access camera {self.camera_id}")
-        
-        # Try to read a few frames to stabilize camera
-        for _ in range(3):
-            ret, _ = cap.read()
-            if not ret:
-                time.sleep(0.1)
-        
-        # Read a frame for detection
-        ret, frame = cap.read()
-        if not ret:
-            cap.release()
-            raise Exception("Failed to capture frame from camera")
-        
-        # Run detection
-        results = self.model(frame)
-        
-        # Count persons (class 0 in COCO dataset)
-        person_count = 0
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                cls = int(box.cls[0])
-                conf = float(box.conf[0])
-                
-                # Filter for persons with confidence > threshold
-                if cls == 0 and conf > self.confidence:
-                    person_count += 1
-                    
-                    # Draw bounding box
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-        
-        # Add count text to frame
-        cv2.putText(
-            frame, 
-            f"People Count: {person_count}", 
-            (10, 30), 
-            cv2.FONT_HERSHEY_SIMPLEX, 
-            1, 
-            (0, 0, 255), 
-            2
-        )
-        
+        result = self._capture_once(annotate=True, sinks=sinks)
+
         # Convert the image to bytes
-        _, buffer = cv2.imencode('.jpg', frame)
+        _, buffer = cv2.imencode('.jpg', result.frame)
         image_bytes = buffer.tobytes()
-        
-        # Clean up
-        cap.release()
-        
-        return person_count, image_bytes
+
+        return result.count, image_bytes
 
 if __name__ == "__main__":
     # Run as standalone script for testing
     detector = HeadcountDetector()
     count = detector.get_current_count()
-    print(f"Current count: {count} people")
\ No newline at end of file
+    print(f"Current count: {count} people")
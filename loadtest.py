@@ -0,0 +1,280 @@
+# loadtest.py
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+# Which server each kind of client talks to, and the path it polls
+ENDPOINTS = {
+    'headcount': ('api', '/api/headcount'),
+    'immediate': ('api', '/api/headcount/{room}/immediate'),
+    'image': ('api', '/api/headcount/{room}/image'),
+    'current_frame': ('web', '/api/current_frame'),
+}
+
+# Paths that answer straight away once a server is up
+READY_PATHS = {'api': '/api/headcount', 'web': '/api/logs'}
+
+DEFAULT_CAMERA = 'synthetic://640x480?fps=15&people=4'
+
+
+def parse_mix(value):
+    """{'headcount': 20, 'image': 2} from 'headcount=20,image=2'"""
+    mix = {}
+    for part in value.split(','):
+        kind, _, clients = part.partition('=')
+        kind = kind.strip()
+        if kind not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint '{kind}', expected one of {', '.join(ENDPOINTS)}")
+        mix[kind] = int(clients or 1)
+    return mix
+
+
+def camera_for_room(camera, index):
+    """Give each simulated room its own seed so the rooms don't all show the same scene"""
+    if not camera.startswith('synthetic://') or 'seed=' in camera:
+        return camera
+    return f"{camera}{'&' if '?' in camera else '?'}seed={index}"
+
+
+def start_server(script, port, env=None, verbose=False):
+    """Start one of the apps on localhost in its own process group"""
+    output = None if verbose else subprocess.DEVNULL
+    return subprocess.Popen(
+        [sys.executable, script, '--port', str(port)],
+        env={**os.environ, **(env or {})},
+        stdout=output,
+        stderr=output,
+        start_new_session=True
+    )
+
+
+def stop_server(process):
+    """Stop a server and anything it started (e.g. the Flask reloader)"""
+    if process.poll() is not None:
+        return
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+def wait_until_ready(base_url, path, timeout=60, process=None):
+    """Poll a server until it answers, raising if it doesn't in time"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise Exception(f"Server for {base_url} exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(base_url + path, timeout=2):
+                return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.5)
+    raise Exception(f"Server at {base_url} did not start within {timeout} seconds")
+
+
+def post_json(url, data, timeout=30):
+    request = urllib.request.Request(
+        url, data=json.dumps(data).encode('utf-8'), headers={'Content-Type': 'application/json'}
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+class LoadClient(threading.Thread):
+    def __init__(self, kind, url_for, rooms, deadline, think_time, timeout, results, index=0):
+        """One simulated client polling an endpoint until the deadline
+
+        Records (kind, start time, latency, error or None) for every request.
+        """
+        super().__init__(daemon=True)
+        self.kind = kind
+        self.url_for = url_for
+        self.rooms = rooms
+        self.deadline = deadline
+        self.think_time = think_time
+        self.timeout = timeout
+        self.results = results
+        self.index = index
+
+    def request_once(self, url):
+        try:
+            with urllib.request.urlopen(url, timeout=self.timeout) as response:
+                body = response.read()
+            # The web app reports a missing frame with success: false
+            if self.kind == 'current_frame' and not json.loads(body).get('success'):
+                return 'no frame'
+            return None
+        except urllib.error.HTTPError as e:
+            return f"HTTP {e.code}"
+        except Exception as e:
+            return type(e).__name__
+
+    def run(self):
+        # Spread the clients over the rooms and stagger their start
+        request_count = self.index
+        time.sleep((self.index % 10) * self.think_time / 10)
+        while time.time() < self.deadline:
+            url = self.url_for(self.kind, self.rooms[request_count % len(self.rooms)])
+            request_count += 1
+            started = time.time()
+            error = self.request_once(url)
+            self.results.append((self.kind, started, time.time() - started, error))
+            if self.think_time:
+                time.sleep(self.think_time)
+
+
+def summarize(results, duration, warmup=0.0):
+    """Throughput, latency percentiles and error rate per endpoint
+
+    Requests started during the warmup are left out.
+    """
+    if not results:
+        return {}
+    first = min(started for _, started, _, _ in results) + warmup
+    summary = {}
+    for kind in sorted({r[0] for r in results}):
+        rows = [r for r in results if r[0] == kind and r[1] >= first]
+        if not rows:
+            continue
+        latencies = np.array([r[2] for r in rows]) * 1000
+        errors = {}
+        for r in rows:
+            if r[3] is not None:
+                errors[r[3]] = errors.get(r[3], 0) + 1
+        error_count = sum(errors.values())
+        summary[kind] = {
+            'requests': len(rows),
+            'throughput': len(rows) / max(duration - warmup, 1e-9),
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p95_ms': float(np.percentile(latencies, 95)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'max_ms': float(latencies.max()),
+            'error_rate': error_count / len(rows),
+            'errors': errors,
+        }
+    return summary
+
+
+def format_summary(summary):
+    lines = [
+        f"{'endpoint':<15}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errors':>9}",
+    ]
+    for kind, stats in summary.items():
+        lines.append(
+            f"{kind:<15}{stats['requests']:>10}{stats['throughput']:>10.1f}{stats['p50_ms']:>10.1f}"
+            f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}{stats['error_rate']:>9.1%}"
+        )
+        for error, count in stats['errors'].items():
+            lines.append(f"{'':<15}{count:>10} x {error}")
+    return "\n".join(lines)
+
+
+def run_load_test(mix, rooms=4, camera=DEFAULT_CAMERA, duration=60, warmup=5, think_time=1.0, timeout=30,
+                  api_port=5100, web_port=5101, async_api=False, api_url=None, web_url=None, verbose=False):
+    """Start the apps on simulated cameras, run the client mix and return the summary
+
+    mix maps endpoint kinds to numbers of clients. Servers are only started
+    for the kinds in the mix, api_url/web_url point at already running
+    servers instead.
+    """
+    servers = {kind_server for kind_server, _ in (ENDPOINTS[kind] for kind in mix)}
+    room_ids = [f"load{index + 1}" for index in range(rooms)]
+    processes = []
+    base_urls = {}
+
+    try:
+        if 'api' in servers:
+            if api_url:
+                base_urls['api'] = api_url.rstrip('/')
+                # Use the rooms the running server knows about
+                with urllib.request.urlopen(base_urls['api'] + '/api/health/cameras', timeout=timeout) as response:
+                    room_ids = list(json.loads(response.read()))
+            else:
+                room_cameras = {room_id: camera_for_room(camera, i) for i, room_id in enumerate(room_ids)}
+                script = 'async_api.py' if async_api else 'api.py'
+                print(f"Starting {script} on port {api_port} with {rooms} simulated rooms")
+                processes.append(start_server(script, api_port, {'HEADCOUNT_ROOM_CAMERAS': json.dumps(room_cameras)}, verbose))
+                base_urls['api'] = f"http://127.0.0.1:{api_port}"
+                wait_until_ready(base_urls['api'], READY_PATHS['api'], process=processes[-1])
+
+        if 'web' in servers:
+            if web_url:
+                base_urls['web'] = web_url.rstrip('/')
+            else:
+                print(f"Starting web_app.py on port {web_port}")
+                processes.append(start_server('web_app.py', web_port, verbose=verbose))
+                base_urls['web'] = f"http://127.0.0.1:{web_port}"
+                wait_until_ready(base_urls['web'], READY_PATHS['web'], process=processes[-1])
+            result = post_json(base_urls['web'] + '/api/start_detection', {
+                'location': 'LoadTest', 'camera_id': camera_for_room(camera, 0), 'save_interval': 5
+            })
+            print(f"Web detection: {result.get('message')}")
+
+        def url_for(kind, room_id):
+            server, path = ENDPOINTS[kind]
+            return base_urls[server] + path.format(room=room_id)
+
+        results = []
+        deadline = time.time() + duration
+        clients = [
+            LoadClient(kind, url_for, room_ids, deadline, think_time, timeout, results, index)
+            for kind, count in mix.items()
+            for index in range(count)
+        ]
+        print(f"Running {len(clients)} clients for {duration} seconds")
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join(timeout + max(0.0, deadline - time.time()) + 1)
+
+        if 'web' in servers:
+            try:
+                post_json(base_urls['web'] + '/api/stop_detection', {})
+            except Exception as e:
+                print(f"Error stopping web detection: {str(e)}")
+
+        return summarize(list(results), duration, warmup)
+    finally:
+        for process in processes:
+            stop_server(process)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the headcount servers on localhost with simulated cameras")
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('headcount=20,immediate=4,image=2,current_frame=10'),
+                        help="Clients per endpoint, e.g. headcount=20,immediate=4,image=2,current_frame=10")
+    parser.add_argument('--rooms', type=int, default=4, help="Number of simulated rooms for the API server")
+    parser.add_argument('--camera', default=DEFAULT_CAMERA,
+                        help="Camera source for every room: synthetic://<w>x<h>?fps=&people=, "
+                             "synthetic://?video=<path> to loop a recording, or a camera index/URL")
+    parser.add_argument('--duration', type=float, default=60, help="Seconds to run the clients")
+    parser.add_argument('--warmup', type=float, default=5, help="Leave out requests from the first seconds")
+    parser.add_argument('--think-time', type=float, default=1.0, help="Seconds each client waits between requests")
+    parser.add_argument('--timeout', type=float, default=30, help="Request timeout in seconds")
+    parser.add_argument('--async-api', action='store_true', help="Test async_api.py instead of api.py")
+    parser.add_argument('--api-port', type=int, default=5100, help="Port for the API server")
+    parser.add_argument('--web-port', type=int, default=5101, help="Port for the web app")
+    parser.add_argument('--api-url', help="Use an already running API server instead of starting one")
+    parser.add_argument('--web-url', help="Use an already running web app instead of starting one")
+    parser.add_argument('--json', dest='json_path', help="Also write the summary to this JSON file")
+    parser.add_argument('--verbose', action='store_true', help="Show the servers' output")
+    args = parser.parse_args()
+
+    summary = run_load_test(
+        args.mix, args.rooms, args.camera, args.duration, args.warmup, args.think_time, args.timeout,
+        args.api_port, args.web_port, args.async_api, args.api_url, args.web_url, args.verbose
+    )
+    print(format_summary(summary))
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(summary, f, indent=2)
@@ -0,0 +1,202 @@
+# log_catalog.py
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from log_format import parse_log_name, read_log_header
+
+CATALOG_FILE = 'catalog.sqlite3'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    file TEXT PRIMARY KEY,
+    room TEXT NOT NULL,
+    start TEXT,
+    end TEXT,
+    rows INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    mode TEXT NOT NULL,
+    scanned INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS logs_room_start ON logs (room, start);
+CREATE INDEX IF NOT EXISTS logs_mtime ON logs (mtime);
+"""
+
+# latest() re-checks this many of the newest logs on disk, in case a writer
+# without a catalog appended to them
+LATEST_CANDIDATES = 5
+
+COLUMNS = ('file', 'room', 'start', 'end', 'rows', 'size', 'mtime', 'mode')
+
+
+class LogCatalog:
+    def __init__(self, logs_dir='data/logs', db_path=None):
+        """Persistent index of the logs in a directory, kept in SQLite
+
+        Holds the room, first and last timestamp, row count, size and mtime of
+        every log, so listing and finding the newest log don't touch the files.
+        Files are only read again from where the last scan stopped, so a log
+        that is being appended to costs just its new rows.
+
+        The directory is only rescanned when its own mtime changes, i.e. when
+        logs are added, removed or renamed. Rows appended to an existing log
+        reach the catalog through update(), which CsvLogSink calls after every
+        write, or through refresh(force=True). latest() also re-checks the
+        newest logs on disk, so it sees appends by any other writer.
+        """
+        self.logs_dir = logs_dir
+        self.db_path = db_path or os.path.join(logs_dir, CATALOG_FILE)
+        self._lock = threading.Lock()
+        self._db = None
+        self._dir_mtime = None
+
+    def _connect(self):
+        # Opened on first use, so creating an analyzer stays cheap
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+            self._db.row_factory = sqlite3.Row
+            # Keep the journal file around instead of creating and deleting it
+            # with every write, which would change the directory's mtime
+            self._db.execute("PRAGMA journal_mode=TRUNCATE")
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    def _scan(self, path, size, mtime, previous=None):
+        """Catalog row for a log, reading only what was added since `previous`"""
+        if previous is not None and size >= previous['scanned']:
+            start, end, rows, offset, mode = (
+                previous['start'], previous['end'], previous['rows'], previous['scanned'], previous['mode']
+            )
+            if not rows:
+                # The start came from the file name, the first row replaces it
+                start = None
+        else:
+            # New or rewritten file
+            start = end = None
+            rows = offset = 0
+            mode = read_log_header(path)['mode']
+
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # Still being written, picked up by the next scan
+                    break
+                offset += len(line)
+                if line.startswith(b'#') or line.startswith(b'timestamp'):
+                    continue
+                timestamp = line.split(b',', 1)[0].decode('utf-8', 'replace').strip()
+                if start is None:
+                    start = timestamp
+                end = timestamp
+                rows += 1
+
+        room, started = parse_log_name(path)
+        if start is None and started is not None:
+            start = started.strftime("%Y-%m-%d %H:%M:%S")
+        return (os.path.basename(path), room, start, end, rows, size, mtime, mode, offset)
+
+    def _store(self, db, row):
+        db.execute(
+            "INSERT OR REPLACE INTO logs (file, room, start, end, rows, size, mtime, mode, scanned) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            row
+        )
+
+    def update(self, path):
+        """Bring one log's entry up to date, e.g. after rows were written to it"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        with self._lock:
+            db = self._connect()
+            previous = db.execute("SELECT * FROM logs WHERE file = ?", (os.path.basename(path),)).fetchone()
+            if previous is not None and previous['size'] == stat.st_size and previous['mtime'] == stat.st_mtime:
+                return
+            with db:
+                self._store(db, self._scan(path, stat.st_size, stat.st_mtime, previous))
+
+    def refresh(self, force=False):
+        """Sync the catalog with the directory, returns the number of changed entries
+
+        Unless forced, does nothing if no log was added or removed since the
+        last scan.
+        """
+        try:
+            # Taken before scanning, so changes during the scan trigger another
+            dir_mtime = os.stat(self.logs_dir).st_mtime_ns
+        except OSError:
+            return 0
+        if not force and dir_mtime == self._dir_mtime:
+            return 0
+
+        with self._lock:
+            db = self._connect()
+            known = {row['file']: row for row in db.execute("SELECT * FROM logs")}
+            changed = 0
+            with db:
+                for entry in os.scandir(self.logs_dir):
+                    if not entry.name.endswith('.csv') or not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    previous = known.pop(entry.name, None)
+                    if previous is not None and previous['size'] == stat.st_size and previous['mtime'] == stat.st_mtime:
+                        continue
+                    try:
+                        self._store(db, self._scan(entry.path, stat.st_size, stat.st_mtime, previous))
+                        changed += 1
+                    except OSError as e:
+                        print(f"Error cataloging {entry.name}: {str(e)}")
+                # Whatever is left was deleted
+                db.executemany("DELETE FROM logs WHERE file = ?", [(name,) for name in known])
+                changed += len(known)
+            self._dir_mtime = dir_mtime
+        return changed
+
+    def logs(self, room=None, date=None):
+        """Catalog entries, optionally only a room's and/or those covering a YYYY-mm-dd date"""
+        self.refresh()
+        query = f"SELECT {', '.join(COLUMNS)} FROM logs"
+        conditions = []
+        params = []
+        if room:
+            conditions.append("room = ?")
+            params.append(room)
+        if date:
+            day = datetime.strptime(date, "%Y-%m-%d")
+            # Sessions that started before the day ends and ended after it began
+            conditions.append("start < ? AND COALESCE(end, start) >= ?")
+            params += [(day + timedelta(days=1)).strftime("%Y-%m-%d"), day.strftime("%Y-%m-%d")]
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY room, start, file"
+
+        with self._lock:
+            return [dict(row) for row in self._connect().execute(query, params)]
+
+    def latest(self):
+        """Name of the most recently modified log, or None
+
+        The newest few logs are stat'ed again first, so appends by writers that
+        don't update the catalog still count.
+        """
+        self.refresh()
+        with self._lock:
+            candidates = self._connect().execute(
+                "SELECT file FROM logs ORDER BY mtime DESC LIMIT ?", (LATEST_CANDIDATES,)
+            ).fetchall()
+        for row in candidates:
+            self.update(os.path.join(self.logs_dir, row['file']))
+        with self._lock:
+            row = self._connect().execute("SELECT file FROM logs ORDER BY mtime DESC LIMIT 1").fetchone()
+        return row['file'] if row else None
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
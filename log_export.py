@@ -0,0 +1,249 @@
+# log_export.py
+import base64
+import csv
+import json
+import os
+from datetime import datetime
+
+from log_format import parse_log_name, read_log_header
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Rows per chunk of the streamed response
+ROWS_PER_CHUNK = 500
+
+
+def parse_time(value, end_of_day=False):
+    """Normalize an ISO-ish date or datetime to the log timestamp format, or None
+
+    With end_of_day a plain date means the end of that day, so it can be used
+    as an inclusive end.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    parsed = datetime.fromisoformat(value.replace('Z', ''))
+    if end_of_day and len(value) == len('YYYY-mm-dd'):
+        parsed = parsed.replace(hour=23, minute=59, second=59)
+    return parsed.strftime(TIMESTAMP_FORMAT)
+
+
+def encode_cursor(log_file, row):
+    return base64.urlsafe_b64encode(json.dumps({"f": log_file, "r": row}).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """(log_file, row) from a cursor, raises ValueError for bad cursors"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return data["f"], int(data["r"])
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def room_logs(logs_dir, room):
+    """A room's log files, oldest session first"""
+    logs = []
+    for entry in os.scandir(logs_dir):
+        if not entry.name.endswith('.csv'):
+            continue
+        location, started = parse_log_name(entry.name)
+        if location == room:
+            logs.append((started or datetime.min, entry.name))
+    return [name for _, name in sorted(logs)]
+
+
+def iter_rows(logs_dir, room, start=None, end=None, cursor=None):
+    """Yield (log_file, row, timestamp, count, change_only, held) for a room's samples in [start, end]
+
+    Reads the logs line by line, never more than one row in memory. Timestamps
+    are compared as strings, which sort the same as the times they hold.
+    A change-only log that was already running at start first yields the
+    count it held then, as a row at start with held set.
+    """
+    cursor_file, cursor_row = cursor if cursor else (None, 0)
+    logs = room_logs(logs_dir, room)
+    if cursor_file is not None:
+        if cursor_file not in logs:
+            raise ValueError(f"Cursor refers to unknown log {cursor_file}")
+        logs = logs[logs.index(cursor_file):]
+
+    for log_file in logs:
+        _, started = parse_log_name(log_file)
+        if end and started and started.strftime(TIMESTAMP_FORMAT) > end:
+            break
+
+        path = os.path.join(logs_dir, log_file)
+        change_only = read_log_header(path)['mode'] == 'change_only'
+        first_row = cursor_row if log_file == cursor_file else 0
+        held = None  # (row, count) in force before start
+        with open(path, newline='') as f:
+            reader = csv.reader(line for line in f if not line.startswith('#'))
+            next(reader, None)  # Header
+            for row, record in enumerate(reader):
+                if row < first_row or len(record) < 2:
+                    continue
+                timestamp = record[0]
+                if start and timestamp < start:
+                    if change_only:
+                        held = (row, int(record[1]))
+                    continue
+                if held is not None:
+                    yield log_file, held[0], start, held[1], change_only, True
+                    held = None
+                if end and timestamp > end:
+                    break
+                yield log_file, row, timestamp, int(record[1]), change_only, False
+
+
+def _epoch(timestamp):
+    return datetime.strptime(timestamp, TIMESTAMP_FORMAT).timestamp()
+
+
+def _new_bucket(key):
+    return {"key": key, "weighted": 0.0, "seconds": 0.0, "total": 0, "samples": 0, "min": None, "max": None}
+
+
+def _include(current, count):
+    current["min"] = count if current["min"] is None else min(current["min"], count)
+    current["max"] = count if current["max"] is None else max(current["max"], count)
+
+
+def _hold(current, count, seconds):
+    """Add `seconds` of a change-only log holding `count` to a bucket"""
+    if seconds > 0:
+        current["weighted"] += count * seconds
+        current["seconds"] += seconds
+        _include(current, count)
+
+
+def _bucket_record(current, bucket):
+    if current["seconds"] > 0:
+        # Change-only logs: how long each count lasted within the bucket
+        average = current["weighted"] / current["seconds"]
+    else:
+        average = current["total"] / current["samples"]
+    return {
+        "timestamp": datetime.fromtimestamp(current["key"] * bucket).strftime(TIMESTAMP_FORMAT),
+        "count": round(average, 2),
+        "min": current["min"],
+        "max": current["max"],
+        "samples": current["samples"],
+    }
+
+
+def iter_records(logs_dir, room, start=None, end=None, cursor=None, limit=None, bucket=None):
+    """Yield export records, then {'next_cursor': ...} if the limit cut the export short
+
+    Records are the logged rows with their log's mode, change-only logs only
+    have a row when the count changed (and the count held at start).
+
+    With bucket (seconds), samples are downsampled to one record per bucket
+    holding the average, min, max and number of samples. Change-only logs
+    hold their count between rows, so their buckets are time-weighted and
+    include the count held over from before the bucket, and buckets in a gap
+    repeat the held count with zero samples. A page may run a few buckets
+    over the limit to finish such a gap.
+    """
+    emitted = 0
+
+    if not bucket:
+        for log_file, row, timestamp, count, change_only, _ in iter_rows(logs_dir, room, start, end, cursor):
+            if limit is not None and emitted >= limit:
+                yield {"next_cursor": encode_cursor(log_file, row)}
+                return
+            yield {"timestamp": timestamp, "count": count, "mode": 'change_only' if change_only else 'interval'}
+            emitted += 1
+        return
+
+    # A page starts at the row that opened a new bucket, the row before it
+    # tells which count was held at the start of that bucket
+    seed = None
+    if cursor and cursor[1] > 0:
+        seed = (cursor[0], cursor[1] - 1)
+        cursor = seed
+
+    current = None
+    previous = None  # (log_file, count, change_only, time) of the last row
+    for log_file, row, timestamp, count, change_only, held in iter_rows(logs_dir, room, start, end, cursor):
+        at = _epoch(timestamp)
+        if seed is not None:
+            is_seed = (log_file, row) == seed
+            seed = None
+            if is_seed:
+                # Its bucket went out with the previous page
+                previous = (log_file, count, change_only, at)
+                continue
+
+        key = int(at // bucket)
+        holding = previous is not None and previous[0] == log_file and previous[2]
+        if current is not None and key != current["key"]:
+            if holding:
+                _hold(current, previous[1], (current["key"] + 1) * bucket - max(previous[3], current["key"] * bucket))
+            if current["min"] is not None:
+                yield _bucket_record(current, bucket)
+                emitted += 1
+            if holding:
+                for gap_key in range(current["key"] + 1, key):
+                    gap = _new_bucket(gap_key)
+                    _hold(gap, previous[1], bucket)
+                    yield _bucket_record(gap, bucket)
+                    emitted += 1
+            current = None
+            if limit is not None and emitted >= limit:
+                # The row that opened the next bucket is where the next page starts
+                yield {"next_cursor": encode_cursor(log_file, row)}
+                return
+
+        if current is None:
+            current = _new_bucket(key)
+            if holding:
+                # Held over from an earlier bucket
+                _hold(current, previous[1], at - max(previous[3], key * bucket))
+        elif holding:
+            _hold(current, previous[1], at - previous[3])
+
+        if not held:
+            current["total"] += count
+            current["samples"] += 1
+            _include(current, count)
+        previous = (log_file, count, change_only, at)
+
+    if current is not None and current["min"] is not None:
+        yield _bucket_record(current, bucket)
+
+
+def stream_csv(records):
+    """Encode export records as CSV text chunks
+
+    A trailing '# next_cursor=<cursor>' line is added when there are more pages.
+    """
+    header = None
+    lines = []
+    for record in records:
+        if "next_cursor" in record:
+            lines.append(f"# next_cursor={record['next_cursor']}\n")
+            continue
+        if header is None:
+            header = list(record)
+            lines.append(",".join(header) + "\n")
+        lines.append(",".join(str(record[key]) for key in header) + "\n")
+        if len(lines) >= ROWS_PER_CHUNK:
+            yield "".join(lines)
+            lines = []
+    if header is None:
+        lines.insert(0, "timestamp,count\n")
+    if lines:
+        yield "".join(lines)
+
+
+def stream_ndjson(records):
+    """Encode export records as newline-delimited JSON text chunks"""
+    lines = []
+    for record in records:
+        lines.append(json.dumps(record) + "\n")
+        if len(lines) >= ROWS_PER_CHUNK:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
@@ -0,0 +1,34 @@
+# log_format.py
+import os
+import re
+from datetime import datetime
+
+def parse_log_name(log_file):
+    """(location, session start) from a '<location>_<YYYYmmdd_HHMMSS>.csv' log name
+
+    The start is None when the name doesn't follow that pattern.
+    """
+    stem = os.path.splitext(os.path.basename(log_file))[0]
+    match = re.match(r'^(.*)_(\d{8}_\d{6})$', stem)
+    if not match:
+        return stem, None
+    try:
+        return match.group(1), datetime.strptime(match.group(2), "%Y%m%d_%H%M%S")
+    except ValueError:
+        return stem, None
+
+def read_log_header(file_path):
+    """Logging options from a log's leading '# key=value,...' comment line
+
+    Logs without one are regular interval logs.
+    """
+    with open(file_path) as f:
+        first_line = f.readline()
+
+    options = {'mode': 'interval'}
+    if first_line.startswith('#'):
+        for part in first_line[1:].strip().split(','):
+            if '=' in part:
+                key, value = part.split('=', 1)
+                options[key.strip()] = value.strip()
+    return options
@@ -0,0 +1,424 @@
+# pipeline.py
+import csv
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import cv2
+
+from camera_health import call_with_timeout, CameraTimeout
+from synthetic_camera import open_capture
+
+# Drop policies for the bounded queues between stages
+BLOCK = 'block'              # Wait for space, the producer slows down to the consumer
+DROP_OLDEST = 'drop_oldest'  # Make room by discarding the oldest queued item
+DROP_NEWEST = 'drop_newest'  # Discard the new item when the queue is full
+
+# Marks the end of the stream, always delivered even with drop policies
+_END = object()
+
+
+class BoundedQueue:
+    def __init__(self, maxsize=2, policy=DROP_OLDEST):
+        """Fixed-size hand-off between two pipeline stages"""
+        if policy not in (BLOCK, DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown drop policy: {policy}")
+        self.policy = policy
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize)
+
+    def put(self, item):
+        """Add an item, applying the drop policy when the queue is full"""
+        if self.policy == BLOCK or item is _END:
+            self._queue.put(item)
+        elif self.policy == DROP_NEWEST:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+        else:
+            while True:
+                try:
+                    self._queue.put_nowait(item)
+                    return
+                except queue.Full:
+                    try:
+                        self._queue.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+
+    def get(self):
+        """Wait for the next item"""
+        return self._queue.get()
+
+
+class FrameResult:
+    def __init__(self, index, timestamp, frame, count, boxes, inference_time=None):
+        """Output of the inference and post-process stages for one frame
+
+        inference_time is how long detection took (seconds), without the
+        capture.
+        """
+        self.index = index
+        self.timestamp = timestamp
+        self.frame = frame
+        self.count = count
+        self.boxes = boxes
+        self.inference_time = inference_time
+
+
+class CameraSource:
+    def __init__(self, camera_id=0, process_every=1, warmup=0, max_frames=None,
+                 open_timeout=None, read_timeout=None):
+        """Frames from a camera (or anything cv2.VideoCapture can open, or a
+        'synthetic://' simulated camera)
+
+        Only every `process_every`-th frame is passed on, `warmup` frames are
+        read and discarded first to let the camera stabilize, and the stream
+        ends after `max_frames` frames when set. Opening or reading a camera
+        that hangs raises CameraTimeout after open_timeout/read_timeout seconds.
+        """
+        self.camera_id = camera_id
+        self.process_every = process_every
+        self.warmup = warmup
+        self.max_frames = max_frames
+        self.open_timeout = open_timeout
+        self.read_timeout = read_timeout
+        self.cap = None
+        self._hung = False
+
+    def open(self):
+        """Open the camera, raising if it is not available"""
+        self.cap = call_with_timeout(
+            lambda: open_capture(self.camera_id),
+            self.open_timeout,
+            on_late_result=lambda cap: cap.release(),
+            key=self.camera_id
+        )
+        if not self.cap.isOpened():
+            self.cap.release()
+            self.cap = None
+            raise Exception(f"Could not access camera {self.camera_id}")
+
+    def _read(self):
+        try:
+            return call_with_timeout(self.cap.read, self.read_timeout, key=self.camera_id)
+        except CameraTimeout:
+            self._hung = True
+            raise
+
+    def frames(self, stop_event):
+        """Yield frames until the camera fails, max_frames is reached or stop is requested"""
+        # Read a few frames to stabilize camera
+        for _ in range(self.warmup):
+            ret, _ = self._read()
+            if not ret:
+                time.sleep(0.1)
+
+        read_count = 0
+        yielded = 0
+        while not stop_event.is_set():
+            ret, frame = self._read()
+            if not ret:
+                if yielded == 0 and self.max_frames is not None:
+                    raise Exception("Failed to capture frame from camera")
+                print("Failed to capture frame from camera")
+                return
+
+            read_count += 1
+            if read_count % self.process_every != 0:
+                continue
+
+            yield frame
+            yielded += 1
+            if self.max_frames is not None and yielded >= self.max_frames:
+                return
+
+    def close(self):
+        """Release the camera"""
+        if self.cap is not None:
+            if self._hung:
+                # A read is still stuck inside OpenCV, release without waiting on it
+                threading.Thread(target=self.cap.release, daemon=True).start()
+            else:
+                self.cap.release()
+            self.cap = None
+
+
+def draw_detections(frame, boxes, count):
+    """Draw person boxes and the count onto a frame in place"""
+    for x1, y1, x2, y2, _ in boxes.astype(int):
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+
+    cv2.putText(
+        frame,
+        f"People Count: {count}",
+        (10, 30),
+        cv2.FONT_HERSHEY_SIMPLEX,
+        1,
+        (0, 0, 255),
+        2
+    )
+    return frame
+
+
+class Sink:
+    """Consumer at the end of the pipeline, each sink runs on its own thread
+
+    handle() may return False to ask the pipeline to stop.
+    """
+    queue_size = 2
+    policy = DROP_OLDEST
+
+    def open(self):
+        pass
+
+    def handle(self, result):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class CsvLogSink(Sink):
+    def __init__(self, log_file, save_interval=5, change_only=False, heartbeat_interval=300, catalog=None):
+        """Append timestamp,count rows to a log every `save_interval` seconds
+
+        In change-only mode a row is only written when the count differs from
+        the last written row, plus a heartbeat row every `heartbeat_interval`
+        seconds and a final row when the session ends. The mode is recorded in
+        a leading comment line so HeadcountAnalyzer can expand it again. A
+        LogCatalog passed as `catalog` is kept up to date with every write.
+        """
+        self.log_file = log_file
+        self.save_interval = save_interval
+        self.change_only = change_only
+        self.heartbeat_interval = heartbeat_interval
+        self.catalog = catalog
+        self._file = None
+        self._writer = None
+        self._last_saved = None
+        self._last_written = None
+        self._pending = None
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.log_file) or '.', exist_ok=True)
+        self._file = open(self.log_file, 'w', newline='')
+        if self.change_only:
+            self._file.write(f"# mode=change_only,interval={self.save_interval},heartbeat={self.heartbeat_interval}\n")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(['timestamp', 'count'])
+        self._file.flush()
+        self._update_catalog()
+
+    def _update_catalog(self):
+        if self.catalog is None:
+            return
+        try:
+            self.catalog.update(self.log_file)
+        except Exception as e:
+            # The log itself matters more than its catalog entry
+            print(f"Error updating log catalog: {str(e)}")
+
+    def _write(self, timestamp, count):
+        formatted = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+        self._writer.writerow([formatted, count])
+        self._file.flush()
+        self._update_catalog()
+        self._last_written = (timestamp, count)
+        self._pending = None
+        print(f"{formatted}: Detected {count} people")
+
+    def handle(self, result):
+        if self._last_saved is not None and result.timestamp - self._last_saved < self.save_interval:
+            return
+        self._last_saved = result.timestamp
+
+        if self.change_only and self._last_written is not None:
+            last_timestamp, last_count = self._last_written
+            if result.count == last_count and result.timestamp - last_timestamp < self.heartbeat_interval:
+                # Unchanged, remember it so the session end can be recorded
+                self._pending = (result.timestamp, result.count)
+                return
+
+        self._write(result.timestamp, result.count)
+
+    def close(self):
+        if self._file is not None:
+            if self._pending is not None:
+                self._write(*self._pending)
+            self._file.close()
+            self._file = None
+
+
+class FramePublisher(Sink):
+    def __init__(self, callback):
+        """Hand every result to a callback, e.g. to update what a web page shows"""
+        self.callback = callback
+
+    def handle(self, result):
+        self.callback(result)
+
+
+class StateStoreSink(Sink):
+    def __init__(self, store, room_id):
+        """Record every count in a HeadcountStore"""
+        self.store = store
+        self.room_id = room_id
+
+    def handle(self, result):
+        self.store.update(self.room_id, result.count, result.timestamp)
+
+
+class CollectSink(Sink):
+    """Keep every result, for short runs that need the results afterwards"""
+    queue_size = 8
+    policy = BLOCK
+
+    def __init__(self):
+        self.results = []
+
+    def handle(self, result):
+        self.results.append(result)
+
+
+class DisplaySink(Sink):
+    def __init__(self, window_name="University Headcount System"):
+        """Show frames in an OpenCV window, pressing 'q' stops the pipeline"""
+        self.window_name = window_name
+
+    def handle(self, result):
+        cv2.imshow(self.window_name, result.frame)
+
+        # Stop if 'q' is pressed
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            return False
+
+    def close(self):
+        cv2.destroyAllWindows()
+
+
+class Pipeline:
+    def __init__(self, source, detector, sinks, annotate=False, queue_size=1, drop_policy=DROP_OLDEST):
+        """Capture -> inference -> post-process -> sinks, each stage on its own thread
+
+        Stages are connected by bounded queues. With the default drop policy
+        inference always works on the freshest frame, and every sink has its
+        own queue so a slow sink (such as disk) never stalls inference.
+        """
+        self.source = source
+        self.detector = detector
+        self.sinks = list(sinks)
+        self.annotate = annotate
+
+        self.frame_queue = BoundedQueue(queue_size, drop_policy)
+        self.result_queue = BoundedQueue(queue_size, drop_policy)
+        self.sink_queues = [BoundedQueue(s.queue_size, s.policy) for s in self.sinks]
+
+        self.stop_event = threading.Event()
+        self.error = None
+        self._threads = []
+
+    def start(self):
+        """Open the source and sinks and start all stage threads
+
+        Raises straight away if the source cannot be opened.
+        """
+        self.source.open()
+        try:
+            for sink in self.sinks:
+                sink.open()
+        except Exception:
+            self.source.close()
+            raise
+
+        targets = [self._capture_stage, self._inference_stage, self._postprocess_stage]
+        targets += [lambda s=s, q=q: self._sink_stage(s, q) for s, q in zip(self.sinks, self.sink_queues)]
+        for target in targets:
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        """Ask the source to stop, queued results still reach the sinks"""
+        self.stop_event.set()
+
+    def join(self, timeout=None):
+        """Wait for every stage to finish"""
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def is_running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def run(self):
+        """Start the pipeline, wait for it to finish and raise any stage error"""
+        self.start()
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+    def _fail(self, error):
+        if self.error is None:
+            self.error = error
+        self.stop()
+
+    def _capture_stage(self):
+        try:
+            for frame in self.source.frames(self.stop_event):
+                self.frame_queue.put((time.time(), frame))
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self.source.close()
+            self.frame_queue.put(_END)
+
+    def _inference_stage(self):
+        index = 0
+        while True:
+            item = self.frame_queue.get()
+            if item is _END:
+                break
+            if self.error is not None:
+                continue  # Drain the queue after a failure
+            timestamp, frame = item
+            try:
+                started = time.perf_counter()
+                count, boxes = self.detector.detect(frame)
+                inference_time = time.perf_counter() - started
+            except Exception as e:
+                self._fail(e)
+                continue
+            self.result_queue.put(FrameResult(index, timestamp, frame, count, boxes, inference_time))
+            index += 1
+        self.result_queue.put(_END)
+
+    def _postprocess_stage(self):
+        while True:
+            result = self.result_queue.get()
+            if result is _END:
+                break
+            if self.annotate:
+                draw_detections(result.frame, result.boxes, result.count)
+            for sink_queue in self.sink_queues:
+                sink_queue.put(result)
+        for sink_queue in self.sink_queues:
+            sink_queue.put(_END)
+
+    def _sink_stage(self, sink, sink_queue):
+        try:
+            while True:
+                result = sink_queue.get()
+                if result is _END:
+                    break
+                try:
+                    if sink.handle(result) is False:
+                        self.stop()
+                except Exception as e:
+                    print(f"Error in {type(sink).__name__}: {str(e)}")
+        finally:
+            sink.close()
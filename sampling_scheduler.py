@@ -0,0 +1,191 @@
+# sampling_scheduler.py
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Rooms with a lecture on (or starting within this many minutes) are boosted
+LECTURE_LEAD_MINUTES = 10
+LECTURE_BOOST = 4.0
+
+# Rooms whose count stayed at zero are sampled much less often
+EMPTY_FACTOR = 0.25
+
+# Samples from this many seconds back decide whether a room is changing
+ACTIVITY_WINDOW = 600
+
+# How often the rates are recomputed from fresh activity (seconds)
+RECOMPUTE_INTERVAL = 30
+
+def load_schedules(config_path='config/classrooms.json'):
+    """Lecture schedules per room ID (lowercase) from the classrooms config
+
+    Each room may have a "schedule" list of {"day": "Mon", "start": "09:00",
+    "end": "11:00"} entries.
+    """
+    try:
+        with open(config_path) as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {
+        room['id'].lower(): room.get('schedule', [])
+        for room in config.get('classrooms', [])
+        if room.get('schedule')
+    }
+
+def lecture_active(schedule, now=None, lead_minutes=LECTURE_LEAD_MINUTES):
+    """Whether a lecture is on, or about to start, according to a schedule"""
+    now = now or datetime.now()
+    soon = now + timedelta(minutes=lead_minutes)
+    day = now.strftime('%a')
+    for entry in schedule:
+        if entry.get('day', day)[:3].title() != day:
+            continue
+        start = datetime.combine(now.date(), datetime.strptime(entry['start'], '%H:%M').time())
+        end = datetime.combine(now.date(), datetime.strptime(entry['end'], '%H:%M').time())
+        if start <= soon and now <= end:
+            return True
+    return False
+
+def allocate_rates(weights, base_rate, budget, min_rate, max_rate):
+    """Sampling rate (samples per second) for each room from its weight
+
+    A room's rate is base_rate times its weight, kept between min_rate and
+    max_rate, so quiet rooms back off in absolute terms. Only if the rates
+    add up to more than the budget are they scaled down in proportion. The
+    minimums are kept even if they add up to more than the budget.
+    """
+    targets = {room_id: min(max_rate, max(min_rate, base_rate * w)) for room_id, w in weights.items()}
+    if sum(targets.values()) <= budget:
+        return targets
+
+    rates = {}
+    remaining = dict(targets)
+    left = budget
+    while remaining:
+        scale = left / sum(remaining.values())
+        floored = [room_id for room_id, rate in remaining.items() if rate * scale < min_rate]
+        if not floored:
+            rates.update({room_id: rate * scale for room_id, rate in remaining.items()})
+            break
+        # Keep the floored rooms at the minimum and scale the rest further
+        for room_id in floored:
+            rates[room_id] = min_rate
+            left -= min_rate
+            del remaining[room_id]
+        left = max(0.0, left)
+    return rates
+
+class AdaptiveScheduler:
+    def __init__(self, rooms, budget=1.0, base_rate=1 / 5, min_rate=1 / 300, max_rate=1 / 2,
+                 store=None, schedules=None, is_ready=None):
+        """Decides which room to sample next within a global inference budget
+
+        A room with weight 1 (occupied and stable) is sampled at base_rate.
+        Rooms whose counts are changing or that have a lecture scheduled are
+        sampled faster, up to max_rate, empty rooms back off towards min_rate.
+        budget caps the total inferences per second across all rooms.
+        is_ready(room_id) can veto rooms, e.g. cameras that are backed off.
+        """
+        self.rooms = list(rooms)
+        self.budget = budget
+        self.base_rate = base_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.store = store
+        self.schedules = schedules or {}
+        self.is_ready = is_ready or (lambda room_id: True)
+
+        self._lock = threading.Lock()
+        self._last_sampled = {room_id: 0.0 for room_id in self.rooms}
+        self._weights = {room_id: 1.0 for room_id in self.rooms}
+        self._rates = allocate_rates(self._weights, base_rate, budget, min_rate, max_rate)
+        self._computed_at = 0.0
+
+    def room_weight(self, room_id, now=None):
+        """Relative sampling priority of a room from its recent activity and schedule"""
+        now = time.time() if now is None else now
+        weight = 1.0
+
+        history = self.store.history(room_id, now - ACTIVITY_WINDOW) if self.store else None
+        if history is not None and len(history[1]) > 0:
+            counts = history[1]
+            if len(counts) > 1:
+                # Average change between samples, relative to the room's occupancy
+                changes = abs(counts[1:].astype(float) - counts[:-1]).mean()
+                weight += changes / max(1.0, counts.mean()) * 10
+            if counts.max() == 0:
+                weight *= EMPTY_FACTOR
+
+        if lecture_active(self.schedules.get(room_id.lower(), []), datetime.fromtimestamp(now)):
+            weight *= LECTURE_BOOST
+        return float(weight)
+
+    def recompute(self, now=None):
+        """Refresh every room's weight and sampling rate"""
+        now = time.time() if now is None else now
+        weights = {room_id: self.room_weight(room_id, now) for room_id in self.rooms}
+        rates = allocate_rates(weights, self.base_rate, self.budget, self.min_rate, self.max_rate)
+        with self._lock:
+            self._weights = weights
+            self._rates = rates
+            self._computed_at = now
+
+    def set_budget(self, budget, base_rate=None):
+        """Change the global budget (and base rate), takes effect straight away"""
+        self.budget = budget
+        if base_rate is not None:
+            self.base_rate = base_rate
+        self.recompute()
+
+    def next_room(self, now=None):
+        """(room_id, seconds to wait) for the room that is due soonest, or (None, wait)"""
+        now = time.time() if now is None else now
+        if now - self._computed_at >= RECOMPUTE_INTERVAL:
+            self.recompute(now)
+
+        with self._lock:
+            due = sorted(
+                (self._last_sampled[room_id] + 1 / self._rates[room_id], room_id)
+                for room_id in self.rooms
+            )
+        for due_at, room_id in due:
+            if due_at > now:
+                return room_id, due_at - now
+            if self.is_ready(room_id):
+                return room_id, 0.0
+        # Everything due is vetoed, check again shortly
+        return None, 1.0
+
+    def lag(self, room_id, now=None):
+        """Seconds a room is overdue for its next sample"""
+        now = time.time() if now is None else now
+        with self._lock:
+            if not self._last_sampled[room_id]:
+                # Never sampled yet, so not late either
+                return 0.0
+            return max(0.0, now - (self._last_sampled[room_id] + 1 / self._rates[room_id]))
+
+    def record(self, room_id, now=None):
+        """Mark a room as sampled (whether or not the sample worked)"""
+        with self._lock:
+            self._last_sampled[room_id] = time.time() if now is None else now
+
+    def status(self):
+        with self._lock:
+            return {
+                "budget": self.budget,
+                "base_rate": self.base_rate,
+                "min_rate": self.min_rate,
+                "max_rate": self.max_rate,
+                "rooms": {
+                    room_id: {
+                        "weight": self._weights[room_id],
+                        "rate": self._rates[room_id],
+                        "interval": 1 / self._rates[room_id],
+                        "last_sampled": self._last_sampled[room_id] or None,
+                    }
+                    for room_id in self.rooms
+                },
+            }
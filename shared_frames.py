@@ -0,0 +1,335 @@
+# shared_frames.py
+import argparse
+import multiprocessing
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from camera_health import call_with_timeout, CameraTimeout
+from synthetic_camera import open_capture
+
+# Tells an inference process to stop, queued on the ready queue once capture is done
+END_OF_STREAM = -1
+
+# Seconds between checks on the capture processes while waiting for results
+RESULT_POLL_INTERVAL = 0.2
+
+# Seconds to wait for a camera to open or return a frame before giving up
+CAMERA_OPEN_TIMEOUT = 10
+CAMERA_READ_TIMEOUT = 5
+
+
+def _attach(name):
+    """Attach to an existing shared memory block without taking ownership of it"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching also registers the block with the
+        # resource tracker, which spawned children share with the owner, so
+        # the block is still only unlinked once by the owner
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedFrameRing:
+    def __init__(self, slots, shape, dtype=np.uint8, context=None):
+        """Preallocated frame slots in shared memory, passed between processes by index
+
+        Producers acquire() a free slot, write the frame straight into frame(slot)
+        and publish() it. Consumers receive() the slot index, read the frame in
+        place and release() the slot. Only small (slot, timestamp, meta) tuples
+        ever go through the queues, frames are never pickled.
+        """
+        context = context or multiprocessing.get_context('spawn')
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+
+        self._shm = shared_memory.SharedMemory(create=True, size=self.frame_bytes * slots)
+        self._owner = True
+        self._free = context.Queue(slots)
+        self._ready = context.Queue()
+        for slot in range(slots):
+            self._free.put(slot)
+        self._frames = self._map_frames()
+
+    def _map_frames(self):
+        return np.ndarray((self.slots, *self.shape), dtype=self.dtype, buffer=self._shm.buf)
+
+    def __getstate__(self):
+        # Child processes get the block name and queues, never the frame data
+        return {
+            'slots': self.slots,
+            'shape': self.shape,
+            'dtype': self.dtype.str,
+            'frame_bytes': self.frame_bytes,
+            'name': self._shm.name,
+            'free': self._free,
+            'ready': self._ready,
+        }
+
+    def __setstate__(self, state):
+        self.slots = state['slots']
+        self.shape = state['shape']
+        self.dtype = np.dtype(state['dtype'])
+        self.frame_bytes = state['frame_bytes']
+        self._shm = _attach(state['name'])
+        self._owner = False
+        self._free = state['free']
+        self._ready = state['ready']
+        self._frames = self._map_frames()
+
+    def frame(self, slot):
+        """Writable numpy view of a slot, no copy"""
+        return self._frames[slot]
+
+    def acquire(self, timeout=None, drop_oldest=True):
+        """Get a free slot to write into
+
+        When every slot is taken and drop_oldest is set, the oldest frame that
+        no consumer has picked up yet is dropped and its slot reused, so a slow
+        consumer never stalls the camera. Returns None on timeout.
+        """
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            pass
+
+        if drop_oldest:
+            try:
+                item = self._ready.get_nowait()
+                if item[0] != END_OF_STREAM:
+                    return item[0]
+                self._ready.put(item)
+            except queue.Empty:
+                pass
+
+        try:
+            return self._free.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def publish(self, slot, timestamp=None, **meta):
+        """Hand a written slot to the consumers"""
+        self._ready.put((slot, time.time() if timestamp is None else timestamp, meta))
+
+    def publish_end(self):
+        """Tell one consumer to stop once the frames queued before this are done"""
+        self._ready.put((END_OF_STREAM, time.time(), {}))
+
+    def receive(self, timeout=None):
+        """Next (slot, timestamp, meta) to process, or None on timeout"""
+        try:
+            return self._ready.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def release(self, slot):
+        """Give a slot back once its frame has been processed"""
+        self._free.put(slot)
+
+    def close(self):
+        """Detach this process from the shared memory, the owner also frees it"""
+        self._frames = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+def open_camera(camera_id, open_timeout=CAMERA_OPEN_TIMEOUT):
+    """Open a camera (or 'synthetic://' source), raising if it is not available in time"""
+    cap = call_with_timeout(
+        lambda: open_capture(camera_id),
+        open_timeout,
+        on_late_result=lambda cap: cap.release(),
+        key=camera_id
+    )
+    if not cap.isOpened():
+        cap.release()
+        raise Exception(f"Could not access camera {camera_id}")
+    return cap
+
+
+def probe_frame_shape(camera_id, open_timeout=CAMERA_OPEN_TIMEOUT, read_timeout=CAMERA_READ_TIMEOUT):
+    """Shape of the frames a camera produces"""
+    cap = open_camera(camera_id, open_timeout)
+    hung = False
+    try:
+        ret, frame = call_with_timeout(cap.read, read_timeout, key=camera_id)
+        if not ret:
+            raise Exception(f"Could not access camera {camera_id}")
+        return frame.shape
+    except CameraTimeout:
+        hung = True
+        raise
+    finally:
+        if hung:
+            # A read is still stuck inside OpenCV, release without waiting on it
+            threading.Thread(target=cap.release, daemon=True).start()
+        else:
+            cap.release()
+
+
+def capture_process(ring, camera_id, source_id=None, process_every=1, max_frames=None,
+                    open_timeout=CAMERA_OPEN_TIMEOUT, read_timeout=CAMERA_READ_TIMEOUT):
+    """Read frames from a camera straight into shared memory slots
+
+    Frames of another size than the ring's are scaled to fit. A camera that
+    doesn't open or return a frame within the timeouts stops this process.
+    """
+    source_id = camera_id if source_id is None else source_id
+    try:
+        cap = open_camera(camera_id, open_timeout)
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        ring.close()
+        return
+
+    read_count = 0
+    published = 0
+    hung = False
+    view = frame = None
+    try:
+        while max_frames is None or published < max_frames:
+            # Skipped frames are grabbed without decoding
+            read_count += 1
+            if read_count % process_every != 0:
+                if not call_with_timeout(cap.grab, read_timeout, key=camera_id):
+                    break
+                continue
+
+            slot = ring.acquire()
+            view = ring.frame(slot)
+            # Decode directly into the slot, OpenCV reuses the buffer when the shape matches
+            ret, frame = call_with_timeout(lambda: cap.read(view), read_timeout, key=camera_id)
+            if not ret:
+                ring.release(slot)
+                break
+            if frame.shape[:2] != view.shape[:2]:
+                if published == 0:
+                    print(f"Camera {camera_id} frames {frame.shape[1]}x{frame.shape[0]} are scaled to "
+                          f"{view.shape[1]}x{view.shape[0]}")
+                cv2.resize(frame, (view.shape[1], view.shape[0]), dst=view, interpolation=cv2.INTER_AREA)
+            elif not np.shares_memory(frame, view):
+                np.copyto(view, frame)
+
+            ring.publish(slot, source=source_id)
+            published += 1
+    except CameraTimeout as e:
+        # The stuck read may still write into its slot, so the slot is never
+        # handed back and the block stays mapped until the process exits
+        print(f"Error: camera {camera_id}: {str(e)}")
+        hung = True
+    finally:
+        # Views into the block have to go before it can be closed
+        view = frame = None
+        if hung:
+            # Release without waiting on the stuck read
+            threading.Thread(target=cap.release, daemon=True).start()
+        else:
+            cap.release()
+            ring.close()
+
+
+def inference_process(ring, results, confidence=0.5, model_path='yolov8n.pt', workers=1):
+    """Run detection on frames from the ring and put small result tuples on `results`
+
+    Exits after receiving an end-of-stream marker.
+    """
+    # Imported here so capture-only processes never load the model
+    from headcount import HeadcountDetector, limit_threads
+    # The inference processes run side by side, each gets its share of the cores
+    limit_threads(workers)
+    detector = HeadcountDetector(confidence=confidence, model_path=model_path)
+
+    try:
+        while True:
+            slot, timestamp, meta = ring.receive()
+            if slot == END_OF_STREAM:
+                break
+            try:
+                count, boxes = detector.detect(ring.frame(slot))
+            finally:
+                ring.release(slot)
+            results.put((meta.get('source'), timestamp, count, boxes))
+    finally:
+        results.put(None)
+        ring.close()
+
+
+def run_shared_memory_detection(cameras, workers=2, slots=None, process_every=3,
+                                confidence=0.5, model_path='yolov8n.pt', max_frames=None, on_result=None,
+                                open_timeout=CAMERA_OPEN_TIMEOUT, read_timeout=CAMERA_READ_TIMEOUT):
+    """Capture each camera in its own process and run inference in `workers` processes
+
+    The slots are sized for the first camera's frames, frames from cameras
+    with another resolution are scaled to that size (and so are their boxes).
+    Cameras can be 'synthetic://' sources. on_result(source, timestamp,
+    count, boxes) is called in this process for every result.
+    """
+    context = multiprocessing.get_context('spawn')
+    shape = probe_frame_shape(cameras[0], open_timeout, read_timeout)
+    slots = slots or 2 * (len(cameras) + workers)
+    ring = SharedFrameRing(slots, shape, context=context)
+    results = context.Queue()
+
+    capturers = [
+        context.Process(target=capture_process, daemon=True,
+                        args=(ring, camera, camera, process_every, max_frames, open_timeout, read_timeout))
+        for camera in cameras
+    ]
+    inferrers = [
+        context.Process(target=inference_process, args=(ring, results, confidence, model_path, workers), daemon=True)
+        for _ in range(workers)
+    ]
+    for process in inferrers + capturers:
+        process.start()
+
+    try:
+        # Results are handled as they arrive, live cameras never finish
+        capturing = list(capturers)
+        finished = 0
+        while finished < workers:
+            if capturing:
+                capturing = [process for process in capturing if process.is_alive()]
+                if not capturing:
+                    # Every camera is done, queue one end marker per inference
+                    # worker behind the remaining frames
+                    for _ in range(workers):
+                        ring.publish_end()
+
+            try:
+                item = results.get(timeout=RESULT_POLL_INTERVAL)
+            except queue.Empty:
+                if not any(process.is_alive() for process in inferrers):
+                    print("Error: every inference process has exited")
+                    break
+                continue
+
+            if item is None:
+                finished += 1
+            elif on_result is not None:
+                on_result(*item)
+            else:
+                source, timestamp, count, _ = item
+                print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))}: camera {source} - {count} people")
+        for process in capturers + inferrers:
+            process.join()
+    finally:
+        ring.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detection with capture and inference in separate processes")
+    parser.add_argument('cameras', nargs='+', help="Camera indexes, video URLs or synthetic:// sources")
+    parser.add_argument('--workers', type=int, default=2, help="Number of inference processes")
+    parser.add_argument('--confidence', type=float, default=0.5, help="Detection confidence threshold")
+    parser.add_argument('--max-frames', type=int, default=None, help="Stop each camera after this many frames")
+    args = parser.parse_args()
+
+    cameras = [int(c) if c.isdigit() else c for c in args.cameras]
+    run_shared_memory_detection(cameras, args.workers, confidence=args.confidence, max_frames=args.max_frames)
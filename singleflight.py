@@ -0,0 +1,95 @@
+# singleflight.py
+import asyncio
+import threading
+import time
+
+
+class _Call:
+    """A single in-flight (or recently finished) call shared by its callers"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished_at = None
+
+
+class SingleFlight:
+    def __init__(self, window=1.0):
+        """Coalesce concurrent calls for the same key into one execution
+
+        Callers that arrive while a call is running wait for it and share its
+        result. A successful result is also reused for `window` seconds after it
+        finishes so a burst of requests only does the work once.
+        """
+        self.window = window
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, max_age=None):
+        """Run fn() for key, or share the result of an in-flight or recent call
+
+        max_age overrides the reuse window for this caller (in seconds).
+        """
+        max_age = self.window if max_age is None else max_age
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None or (
+                call.done.is_set() and time.monotonic() - call.finished_at > max_age
+            )
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                call.finished_at = time.monotonic()
+                call.done.set()
+                # Never reuse failures, the next caller should try again
+                if call.error is not None:
+                    with self._lock:
+                        if self._calls.get(key) is call:
+                            del self._calls[key]
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+class AsyncSingleFlight:
+    def __init__(self, window=1.0):
+        """SingleFlight for coroutines, waiting callers hold no thread
+
+        The shared call runs as its own task, so a caller that goes away (e.g. a
+        disconnected client) doesn't cancel it for the others. Must be used from
+        a single event loop.
+        """
+        self.window = window
+        self._calls = {}
+
+    async def do(self, key, fn, max_age=None):
+        """Await fn() for key, or share the result of an in-flight or recent call
+
+        fn is a coroutine function. max_age overrides the reuse window for this
+        caller (in seconds).
+        """
+        max_age = self.window if max_age is None else max_age
+
+        call = self._calls.get(key)
+        if call is None or (call.done() and time.monotonic() - call.finished_at > max_age):
+            call = asyncio.ensure_future(fn())
+            call.add_done_callback(lambda finished: self._finish(key, finished))
+            self._calls[key] = call
+        return await asyncio.shield(call)
+
+    def _finish(self, key, call):
+        call.finished_at = time.monotonic()
+        # Never reuse failures, the next caller should try again
+        if (call.cancelled() or call.exception() is not None) and self._calls.get(key) is call:
+            del self._calls[key]
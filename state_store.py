@@ -0,0 +1,93 @@
+# state_store.py
+import threading
+import time
+import numpy as np
+
+# Samples kept per room unless told otherwise, one hour at one sample every 5 seconds
+DEFAULT_HISTORY_SIZE = 720
+
+class RingBuffer:
+    def __init__(self, capacity=DEFAULT_HISTORY_SIZE):
+        """Fixed-size buffer of (timestamp, count) samples, oldest overwritten first"""
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.counts = np.zeros(capacity, dtype=np.int32)
+        self.size = 0
+        self.head = 0  # Index the next sample is written to
+
+    def append(self, timestamp, count):
+        """Add a sample, overwriting the oldest one when full"""
+        self.timestamps[self.head] = timestamp
+        self.counts[self.head] = count
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def snapshot(self, since=None):
+        """Copy of the samples in chronological order, optionally only those after `since`"""
+        if self.size < self.capacity:
+            timestamps = self.timestamps[:self.size].copy()
+            counts = self.counts[:self.size].copy()
+        else:
+            # np.roll copies, so the result never aliases the live buffer
+            timestamps = np.roll(self.timestamps, -self.head)
+            counts = np.roll(self.counts, -self.head)
+
+        if since is not None:
+            mask = timestamps > since
+            timestamps, counts = timestamps[mask], counts[mask]
+        return timestamps, counts
+
+class HeadcountStore:
+    def __init__(self, history_size=DEFAULT_HISTORY_SIZE):
+        """Thread-safe latest sample and recent history for every room"""
+        self.history_size = history_size
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._updated_at = {}
+        self._history = {}
+
+    def update(self, room_id, count, timestamp=None):
+        """Record a new sample for a room and return the stored record"""
+        timestamp = time.time() if timestamp is None else timestamp
+        record = {
+            "count": count,
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)),
+            "room_id": room_id
+        }
+        with self._lock:
+            if room_id not in self._history:
+                self._history[room_id] = RingBuffer(self.history_size)
+            self._history[room_id].append(timestamp, count)
+            self._latest[room_id] = record
+            self._updated_at[room_id] = timestamp
+        return dict(record)
+
+    def latest(self, room_id):
+        """Latest record for a room, or None if it has no samples yet"""
+        with self._lock:
+            record = self._latest.get(room_id)
+            return dict(record) if record else None
+
+    def all_latest(self):
+        """Consistent snapshot of the latest record for every room"""
+        with self._lock:
+            return [dict(record) for record in self._latest.values()]
+
+    def age(self, room_id):
+        """Seconds since the room's latest sample, or None if it has none"""
+        with self._lock:
+            updated_at = self._updated_at.get(room_id)
+        return None if updated_at is None else time.time() - updated_at
+
+    def history(self, room_id, since=None):
+        """(timestamps, counts) arrays of recent samples for a room, or None"""
+        with self._lock:
+            buffer = self._history.get(room_id)
+            if buffer is None:
+                return None
+            return buffer.snapshot(since)
+
+    def rooms(self):
+        """Room IDs that have at least one sample"""
+        with self._lock:
+            return list(self._latest)
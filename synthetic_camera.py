@@ -0,0 +1,131 @@
+# synthetic_camera.py
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs
+
+import cv2
+import numpy as np
+
+SYNTHETIC_PREFIX = 'synthetic://'
+
+
+class SyntheticCapture:
+    def __init__(self, spec):
+        """A stand-in for cv2.VideoCapture that plays a simulated camera
+
+        spec is 'synthetic://<width>x<height>?fps=15&people=4&seed=1' for
+        generated frames with moving figures, or 'synthetic://?video=<path>' to
+        loop a recorded video. Either way read() is paced at the camera's frame
+        rate like a live camera, instead of returning frames as fast as
+        possible.
+        """
+        parts = urlsplit(spec)
+        options = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+
+        self.video = None
+        if options.get('video'):
+            self.video = cv2.VideoCapture(options['video'])
+            fps = self.video.get(cv2.CAP_PROP_FPS) or 15
+            width = int(self.video.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(self.video.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        else:
+            fps = 15
+            width, height = 640, 480
+            if parts.netloc:
+                width, height = (int(v) for v in parts.netloc.lower().split('x'))
+        self.fps = float(options.get('fps', fps))
+        self.width = width
+        self.height = height
+
+        rng = np.random.default_rng(int(options.get('seed', 0)))
+        people = int(options.get('people', 4))
+        # Position and velocity (pixels per frame) of each figure
+        self._people = np.column_stack([
+            rng.uniform(0, width, people), rng.uniform(0, height, people),
+            rng.uniform(-3, 3, people), rng.uniform(-1, 1, people),
+        ])
+        self._background = np.tile(np.linspace(60, 200, width, dtype=np.uint8)[None, :, None], (height, 1, 3))
+
+        self._lock = threading.Lock()
+        self._opened = self.video.isOpened() if self.video is not None else True
+        self._next_frame = time.monotonic()
+
+    def isOpened(self):
+        return self._opened
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        return 0.0
+
+    def _wait_for_frame(self):
+        # Frames arrive at the camera's rate, like a live stream
+        now = time.monotonic()
+        if self._next_frame > now:
+            time.sleep(self._next_frame - now)
+        self._next_frame = max(self._next_frame, now) + 1 / self.fps
+
+    def _move(self):
+        people = self._people
+        people[:, 0] = (people[:, 0] + people[:, 2]) % self.width
+        people[:, 1] = (people[:, 1] + people[:, 3]) % self.height
+
+    def _render(self, image):
+        frame = image if image is not None and image.shape == self._background.shape else None
+        if frame is None:
+            frame = self._background.copy()
+        else:
+            np.copyto(frame, self._background)
+
+        self._move()
+        size = max(8, self.height // 6)
+        for x, y, _, _ in self._people:
+            x, y = int(x), int(y)
+            cv2.circle(frame, (x, y - size // 2), size // 5, (40, 40, 40), -1)
+            cv2.rectangle(frame, (x - size // 5, y - size // 3), (x + size // 5, y + size // 2), (30, 30, 90), -1)
+        return frame
+
+    def grab(self):
+        with self._lock:
+            if not self._opened:
+                return False
+            self._wait_for_frame()
+            if self.video is not None:
+                return self._read_video(None)[0]
+            # Skipped frames aren't drawn, the figures still move
+            self._move()
+            return True
+
+    def _read_video(self, image):
+        ret, frame = self.video.read(image)
+        if not ret:
+            # Loop the recording
+            self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.video.read(image)
+        return ret, frame
+
+    def read(self, image=None):
+        with self._lock:
+            if not self._opened:
+                return False, None
+            self._wait_for_frame()
+            if self.video is not None:
+                return self._read_video(image)
+            return True, self._render(image)
+
+    def release(self):
+        with self._lock:
+            self._opened = False
+            if self.video is not None:
+                self.video.release()
+
+
+def open_capture(camera_id):
+    """cv2.VideoCapture for a camera, or a SyntheticCapture for 'synthetic://' sources"""
+    if isinstance(camera_id, str) and camera_id.startswith(SYNTHETIC_PREFIX):
+        return SyntheticCapture(camera_id)
+    return cv2.VideoCapture(camera_id)
@@ -1,8 +1,8 @@
 # web_app.py
-from flask import Flask, request, jsonify, render_template, Response
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context
 from flask_cors import CORS
-import cv2
 import base64
+import argparse
 import json
 import os
 from datetime import datetime
@@ -11,6 +11,9 @@ import threading
 # Import your existing modules
 from headcount import HeadcountDetector
 from analyzer import HeadcountAnalyzer
+from pipeline import Pipeline, CameraSource, CsvLogSink, FramePublisher
+from frame_slot import FrameSlot
+import log_export
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 CORS(app)  # Enable cross-origin requests
@@ -19,9 +22,9 @@ CORS(app)  # Enable cross-origin requests
 detector = None
 analyzer = HeadcountAnalyzer()
 detection_thread = None
-stop_detection = False
-current_frame = None
-current_count = 0
+detection_pipeline = None
+# Latest raw frame and detections, only annotated when a viewer asks for it
+frame_slot = FrameSlot()
 
 @app.route('/')
 def index():
@@ -31,7 +34,7 @@ def index():
 @app.route('/api/start_detection', methods=['POST'])
 def start_detection():
     """Start the headcount detection in a separate thread"""
-    global detection_thread, stop_detection, detector
+    global detection_thread, detection_pipeline, detector
     
     if detection_thread and detection_thread.is_alive():
         return jsonify({'success': False, 'message': 'Detection already running'})
@@ -39,20 +42,32 @@ def start_detection():
     try:
         data = request.json
         location = data.get('location', 'Classroom')
-        camera_id = int(data.get('camera_id', 0))
+        camera_id = data.get('camera_id', 0)
+        # Camera indexes are numbers, anything else is a video URL or synthetic source
+        camera_id = int(camera_id) if str(camera_id).isdigit() else camera_id
         confidence = float(data.get('confidence', 0.5))
         save_interval = int(data.get('save_interval', 5))
+        change_only = bool(data.get('change_only', False))
         
         # Initialize detector here to ensure it's in the correct thread
         detector = HeadcountDetector(camera_id=camera_id, confidence=confidence)
         
-        # Reset the flag
-        stop_detection = False
+        # Prepare for logging
+        log_file = f'data/logs/{location}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        
+        # Only process every few frames to reduce CPU usage
+        frame_slot.clear()
+        detection_pipeline = Pipeline(
+            CameraSource(camera_id, process_every=3),
+            detector,
+            [CsvLogSink(log_file, save_interval, change_only=change_only, catalog=analyzer.catalog),
+             FramePublisher(frame_slot.publish)]
+        )
         
         # Start detection in a background thread
         detection_thread = threading.Thread(
             target=run_detection_thread,
-            args=(location, camera_id, confidence, save_interval)
+            args=(detection_pipeline, location, log_file)
         )
         detection_thread.daemon = True
         detection_thread.start()
@@ -64,41 +79,42 @@ def start_detection():
 @app.route('/api/stop_detection', methods=['POST'])
 def stop_detection_endpoint():
     """Stop the currently running detection"""
-    global stop_detection
-    
     if not detection_thread or not detection_thread.is_alive():
         return jsonify({'success': False, 'message': 'No detection running'})
     
-    stop_detection = True
+    if detection_pipeline is not None:
+        detection_pipeline.stop()
     return jsonify({'success': True, 'message': 'Detection stopping...'})
 
 @app.route('/api/current_frame')
 def get_current_frame():
     """Get the latest processed frame with detections"""
-    global current_frame, current_count
-    
-    if current_frame is None:
+    if frame_slot.latest() is None:
         return jsonify({'success': False, 'message': 'No frame available'})
     
     try:
-        # Convert the OpenCV frame to a base64 encoded JPEG
-        _, buffer = cv2.imencode('.jpg', current_frame)
-        frame_base64 = base64.b64encode(buffer).decode('utf-8')
+        # Annotate and encode the frame, at most once per new frame
+        image_bytes, count = frame_slot.jpeg()
+        frame_base64 = base64.b64encode(image_bytes).decode('utf-8')
         
         return jsonify({
             'success': True,
             'frame': f'data:image/jpeg;base64,{frame_base64}',
-            'count': current_count
+            'count': count
         })
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error encoding frame: {str(e)}'})
 
 @app.route('/api/logs')
 def get_logs():
-    """Get a list of available log files"""
+    """Get a list of available log files
+
+    Optional ?room=<location> and ?date=<YYYY-mm-dd> filters. The catalog
+    entries (start, end, rows, size...) are returned alongside the names.
+    """
     try:
-        logs = analyzer.get_available_logs()
-        return jsonify({'success': True, 'logs': logs})
+        entries = analyzer.catalog.logs(request.args.get('room'), request.args.get('date'))
+        return jsonify({'success': True, 'logs': [entry['file'] for entry in entries], 'details': entries})
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error getting logs: {str(e)}'})
 
@@ -144,90 +160,59 @@ def visualize_log(log_file):
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error visualizing log: {str(e)}'})
 
-def run_detection_thread(location, camera_id, confidence, save_interval):
+@app.route('/api/export/<room>')
+def export_room(room):
+    """Stream a room's samples between start and end as chunked CSV or NDJSON
+
+    Query parameters: start, end (ISO dates or datetimes, a plain end date
+    includes that whole day), format (csv or
+    ndjson), limit (records per page), cursor (from the previous page) and
+    every (bucket size in seconds for server-side downsampling). When a page
+    is cut short by the limit it ends with the cursor for the next page.
+    """
+    try:
+        start = log_export.parse_time(request.args.get('start'))
+        end = log_export.parse_time(request.args.get('end'), end_of_day=True)
+        limit = request.args.get('limit', type=int)
+        every = request.args.get('every', type=int)
+        cursor = request.args.get('cursor')
+        cursor = log_export.decode_cursor(cursor) if cursor else None
+        if cursor and cursor[0] not in log_export.room_logs(analyzer.logs_dir, room):
+            raise ValueError('Cursor does not belong to this room')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Invalid export parameters: {str(e)}'}), 400
+
+    export_format = request.args.get('format', 'csv')
+    if export_format == 'csv':
+        encode, mimetype = log_export.stream_csv, 'text/csv'
+    elif export_format == 'ndjson':
+        encode, mimetype = log_export.stream_ndjson, 'application/x-ndjson'
+    else:
+        return jsonify({'success': False, 'message': 'Format must be csv or ndjson'}), 400
+    if (limit is not None and limit <= 0) or (every is not None and every <= 0):
+        return jsonify({'success': False, 'message': 'limit and every must be positive'}), 400
+
+    records = log_export.iter_records(analyzer.logs_dir, room, start, end, cursor, limit, every)
+    return Response(stream_with_context(encode(records)), mimetype=mimetype)
+
+def run_detection_thread(pipeline, location, log_file):
     """Background thread to run the headcount detection"""
-    global current_frame, current_count, stop_detection, detector
-    
     try:
-        # Initialize video capture
-        cap = cv2.VideoCapture(camera_id)
-        
-        if not cap.isOpened():
-            print("Error: Could not access webcam")
-            return
-            
-        # Prepare for logging
-        log_file = f'data/logs/{location}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        os.makedirs(os.path.dirname(log_file), exist_ok=True)
-        
-        with open(log_file, 'w', newline='') as f:
-            f.write('timestamp,count\n')
-        
-        print(f"Starting headcount detection for {location}")
-        
-        frame_count = 0
-        
-        while not stop_detection:
-            # Read frame from webcam
-            ret, frame = cap.read()
-            if not ret:
-                print("Failed to capture frame from camera")
-                break
-                
-            frame_count += 1
-            
-            # Only process every few frames to reduce CPU usage
-            if frame_count % 3 == 0:
-                # Run detection
-                results = detector.model(frame)
-                
-                # Count persons (class 0 in COCO dataset)
-                person_count = 0
-                for result in results:
-                    boxes = result.boxes
-                    for box in boxes:
-                        cls = int(box.cls[0])
-                        conf = float(box.conf[0])
-                        
-                        # Filter for persons with confidence > threshold
-                        if cls == 0 and conf > detector.confidence:
-                            person_count += 1
-                            
-                            # Draw bounding box
-                            x1, y1, x2, y2 = map(int, box.xyxy[0])
-                            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                
-                # Update global variables
-                current_count = person_count
-                
-                # Add count text to frame
-                cv2.putText(
-                    frame, 
-                    f"People Count: {person_count}", 
-                    (10, 30), 
-                    cv2.FONT_HERSHEY_SIMPLEX, 
-                    1, 
-                    (0, 0, 255), 
-                    2
-                )
-                
-                # Update the current frame
-                current_frame = frame.copy()
-                
-                # Log count at regular intervals
-                if frame_count % (save_interval * 30) == 0:  # Approx every 'save_interval' seconds
-                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    with open(log_file, 'a', newline='') as f:
-                        f.write(f"{timestamp},{person_count}\n")
-                    print(f"{timestamp}: Detected {person_count} people")
-        
-        # Clean up
-        cap.release()
-        print(f"Headcount session ended. Log saved to {log_file}")
+        pipeline.start()
     except Exception as e:
         print(f"Error in detection thread: {str(e)}")
+        return
+    
+    print(f"Starting headcount detection for {location}")
+    
+    pipeline.join()
+    print(f"Headcount session ended. Log saved to {log_file}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headcount web interface")
+    parser.add_argument('--port', type=int, default=5000, help="Port to listen on")
+    args = parser.parse_args()
+
     try:
         # Make sure the directories exist
         os.makedirs('data/logs', exist_ok=True)
@@ -236,6 +221,6 @@ if __name__ == "__main__":
         print("Starting web server...")
         
         # Run the Flask app - Use debug=False in production
-        app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
+        app.run(host='0.0.0.0', port=args.port, debug=True, use_reloader=False)
     except Exception as e:
         print(f"Error starting web server: {str(e)}")
\ No newline at end of file